@@ -7,20 +7,39 @@ UNAUGMENT_PATTERN = re.compile(r'_\d+$')
 
 
 class AugmentingLexicon:
+    """Restricts a lexicon to the augmented lexical subterms of a target MR.
+
+    The meanings of a word are the lexical subterms of the augmented target
+    MR (available as augmented_mr) that are equivalent to one of its meanings
+    in lex when unaugmented. They are found via an index keyed by the
+    canonical keys of the unaugmented lexical subterms.
+    """
 
     def __init__(self, lex, target_mr):
         self.lex = lex
-        mr = target_mr.augment()
-        self.lst = list(lexicon.lexical_subterms(mr))
-        self.lst = [terms.from_string(l.to_string()) for l in self.lst] # undo variable bindings
+        self.augmented_mr = target_mr.augment()
+        self.lst = [lexicon.instantiate(l) # undo variable bindings
+                for l in lexicon.lexical_subterms(self.augmented_mr)]
+        self.index = {}
+        for l in self.lst:
+            unaugmented = terms.make_complex_term(unaugment(l.functor_name), l.args)
+            self.index.setdefault(unaugmented.canonical_key(), []).append(l)
 
     def meanings(self, word):
-        meanings = self.lex.meanings(word)
-        for m in meanings:
-            for l in self.lst:
-                unaugmented = terms.ComplexTerm(unaugment(l.functor_name), l.args)
-                if unaugmented.equivalent(m):
-                    yield l
+        for m in self.lex.templates(word):
+            yield from self.augmented(m)
+
+    def spans(self, words, max_length=None):
+        """Like Lexicon.spans, with augmented meanings.
+        """
+        for start, end, m in self.lex.spans(words, max_length):
+            for l in self.augmented(m):
+                yield start, end, l
+
+    def augmented(self, meaning):
+        """Returns the lexical subterms of the target MR that augment meaning.
+        """
+        return self.index.get(meaning.canonical_key(), ())
 
 
 def unaugment(name):
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+
+
+"""Benchmarks for the term machinery of GeoPar.
+
+Run a benchmark with
+
+    python3 -m bench NAME
+
+where NAME is one of the functions listed in BENCHMARKS.
+"""
+
+
+import array
+import augment
+import collections
+import data
+import gc
+import lexicon
+import lstack
+import models
+import parsestacks
+import seensets
+import sys
+import termarrays
+import terms
+import time
+import tracemalloc
+
+
+def measure(function, *args):
+    """Calls function and returns its result, wall time and peak memory.
+
+    function is called twice because tracing memory slows it down a lot: once
+    for timing and once for measuring memory.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    function(*args)
+    seconds = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    result = function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def report(label, seconds, peak):
+    print('{:<40} {:>8.3f} s {:>12,} bytes peak'.format(label, seconds, peak))
+
+
+def interning():
+    """Compares interned and uninterned terms.
+
+    Reads the training data and keeps all fragments of all subterms of all MRs
+    in memory, similar to what an oracle beam holds.
+    """
+    def build():
+        fragments = [f for words, mr in data.geo880_train() for s in mr.subterms() for f in s.fragments()]
+        return len(fragments)
+    for enabled in (False, True):
+        terms.set_interning(enabled)
+        count, seconds, peak = measure(build)
+        report('interning={}, {} fragments'.format(enabled, count), seconds, peak)
+    terms.set_interning(True)
+
+
+def oracle_examples():
+    """Returns the training examples paired with their oracles.
+
+    Each example is a tuple of words, MR and action sequence. Examples for
+    which oracles.json has no oracle are left out.
+    """
+    oracles = iter(data.read_oracle_file('oracles.json'))
+    oracle_words, actions = next(oracles)
+    result = []
+    for words, mr in data.geo880_train():
+        if list(words) == list(oracle_words):
+            result.append((words, mr, actions))
+            oracle_words, actions = next(oracles, (None, None))
+    return result
+
+
+def canonical_keys():
+    """Compares to_string/subsumes-based comparisons with canonical keys.
+
+    For each of the oracles in oracles.json, counts the lexical subterms of the
+    augmented target MR once per action, as the Rejector does for each item,
+    and compares every shifted term with every unaugmented lexical subterm, as
+    the AugmentingLexicon does.
+    """
+    workload = []
+    for words, mr, actions in oracle_examples():
+        lsts = list(lexicon.lexical_subterms(mr.augment()))
+        unaugmented = [terms.make_complex_term(augment.unaugment(l.functor_name), l.args) for l in lsts]
+        shifted = [terms.from_string(a[2]) for a in actions if a[0] == 'shift']
+        workload.append((len(actions), lsts, unaugmented, shifted))
+    def with_strings():
+        equivalent = 0
+        for steps, lsts, unaugmented, shifted in workload:
+            for step in range(steps):
+                collections.Counter(l.to_string() for l in lsts)
+            for s in shifted:
+                for u in unaugmented:
+                    if s.subsumes(u) and u.subsumes(s):
+                        equivalent += 1
+        return equivalent
+    def with_keys():
+        equivalent = 0
+        for steps, lsts, unaugmented, shifted in workload:
+            for step in range(steps):
+                collections.Counter(l.canonical_key() for l in lsts)
+            for s in shifted:
+                for u in unaugmented:
+                    if s.canonical_key() == u.canonical_key():
+                        equivalent += 1
+        return equivalent
+    for label, function in (('to_string/subsumes', with_strings), ('canonical keys', with_keys)):
+        equivalent, seconds, peak = measure(function)
+        report('{}, {} equivalent'.format(label, equivalent), seconds, peak)
+
+
+def object_sizes():
+    """Reports the size in bytes of an instance of each term and stack class.
+
+    Includes the size of the per-instance dict, if any.
+    """
+    term = terms.from_string('a(A,b,1,(c(A),d(A)))')
+    stack = lstack.stack([term])
+    objects = [term.args[0], term.args[1], term.args[2], term, term.args[3],
+            stack, parsestacks.new_element(term)]
+    for obj in objects:
+        size = sys.getsizeof(obj)
+        if hasattr(obj, '__dict__'):
+            size += sys.getsizeof(obj.__dict__)
+        print('{:<40} {:>8} bytes'.format(type(obj).__name__, size))
+
+
+def memory(examples=10):
+    """Reports peak memory per oracle search and per parser.parse call.
+
+    Uses the first few oracle examples. Parsing uses an untrained model. Run
+    on two revisions to compare them.
+    """
+    # These depend on parseitems, which is part of the exercise, so the other
+    # benchmarks can run without it:
+    import oracle
+    import parser
+    lex = lexicon.load_lexicon('lexicon.txt')
+    model = models.Perceptron()
+    def parse(words):
+        try:
+            return parser.parse(words, lex, model)
+        except ValueError:
+            return None
+    oracle_peaks = []
+    parse_peaks = []
+    for words, mr, actions in oracle_examples()[:examples]:
+        _, seconds, peak = measure(oracle.action_sequence, words, mr)
+        oracle_peaks.append(peak)
+        report('oracle, {} words'.format(len(words)), seconds, peak)
+        _, seconds, peak = measure(parse, words)
+        parse_peaks.append(peak)
+        report('parse, {} words'.format(len(words)), seconds, peak)
+    for label, peaks in (('oracle', oracle_peaks), ('parse', parse_peaks)):
+        print('{:<40} {:>12,} bytes mean peak, {:,} max'.format(
+                label, sum(peaks) // len(peaks), max(peaks)))
+
+
+def search(examples=None):
+    """Compares breadth-first and A* oracle search.
+
+    Reports the number of expanded items and the time for each training
+    example with an oracle (or the first few), and the totals.
+    """
+    import oracle # see memory
+    totals = {'bfs': [0, 0.0], 'astar': [0, 0.0]}
+    for words, mr, actions in oracle_examples()[:examples]:
+        for mode in ('bfs', 'astar'):
+            stats = collections.Counter()
+            start = time.perf_counter()
+            found = oracle.action_sequence(words, mr, mode, stats)
+            seconds = time.perf_counter() - start
+            totals[mode][0] += stats['expanded']
+            totals[mode][1] += seconds
+            print('{:<6} {:>3} words {:>4} actions {:>10,} expanded {:>8.3f} s {:>12,} bytes seen'.format(
+                    mode, len(words), len(found), stats['expanded'], seconds, stats['seen_memory']))
+    for mode, (expanded, seconds) in totals.items():
+        print('{:<6} total {:>10,} expanded {:>8.3f} s'.format(mode, expanded, seconds))
+
+
+def seen_keys():
+    """Compares two ways of checking a step's successors for duplicates.
+
+    The workload stands in for the item encodings of oracle.item_codes: the
+    encoded fragments of the training MRs, split into batches of various
+    sizes (one batch per step). The batched way finds duplicates within a
+    batch with termarrays.first_occurrences before adding the rows to a seen
+    set, the simple way, used by oracle.Beam.check_seen, adds the bytes of
+    each encoding directly, which also catches duplicates within a batch.
+    """
+    symbols = termarrays.SymbolTable()
+    rows = [symbols.encode(f) for words, mr in data.geo880_train()
+            for s in mr.subterms() for f in s.fragments()]
+    def batched(batches):
+        seen = seensets.SeenSet()
+        for batch in batches:
+            first = termarrays.first_occurrences(batch)
+            for j in range(len(batch)):
+                if first[j]:
+                    seen.add(batch[j].tobytes(), 0)
+        return len(seen.sets[None].digests)
+    def simple(batches):
+        seen = seensets.SeenSet()
+        for batch in batches:
+            for row in batch:
+                seen.add(array.array('q', row).tobytes(), 0)
+        return len(seen.sets[None].digests)
+    for size in (10, 100, 1000, 10000):
+        chunks = [rows[i:i + size] for i in range(0, len(rows), size)]
+        for label, function, batches in (
+                ('batched', batched, [termarrays.make_batch(c) for c in chunks]),
+                ('simple', simple, chunks)):
+            unique, seconds, peak = measure(function, batches)
+            report('{} x {}, {}, {} unique'.format(len(chunks), size, label, unique), seconds, peak)
+
+
+BENCHMARKS = {
+    'interning': interning,
+    'canonical_keys': canonical_keys,
+    'object_sizes': object_sizes,
+    'memory': memory,
+    'search': search,
+    'seen_keys': seen_keys,
+}
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        print(name)
+        BENCHMARKS[name]()
@@ -1,2 +1,17 @@
 MAX_TOKEN_LENGTH = 3
 
+# Duplicate detection in oracle search, see seensets:
+SEEN_SET = 'exact' # or 'bloom'
+SEEN_SCOPE = 'search' # or 'offset' or 'step'
+SEEN_BLOOM_CAPACITY = 1000000 # expected number of items, for 'bloom'
+SEEN_BLOOM_ERROR_RATE = 0.001 # false positive rate at capacity, for 'bloom'
+
+# Parser model, see models.new_model:
+MODEL = 'perceptron' # or 'dictionary' or 'hashing'
+HASHING_SIZE = 1 << 20
+
+# Beam search in the parser, see parser.BeamSearch:
+BEAM_WIDTH = 10
+BEAM_WIDTH_PER_WORD = 0 # added to BEAM_WIDTH per word of the sentence
+BEAM_MARGIN = None # or the largest score difference to the best item
+BEAM_MAX_STEPS = None
@@ -1,21 +1,57 @@
+#!/usr/bin/env python3
+
+
+"""Reading (and compiling) GeoQuery data and oracle files.
+
+GeoQuery data files contain terms like parse([...], answer(...)), one per line.
+Oracle files contain one JSON object per line, with the words and the action
+sequence of a training example.
+
+Both kinds of files can be compiled into binary term files (see termfiles),
+which load much faster because nothing needs to be parsed. The read functions
+accept either format. To compile a file, run
+
+    python3 -m data geoquery|oracles INPUT OUTPUT
+"""
+
+
+import itertools
 import json
 import os
 import random
+import sys
+import termfiles
 import terms
 
 
 def read_geoquery_file(path):
+    if termfiles.is_term_file(path):
+        term_file = termfiles.TermFile(path)
+        parse_terms = list(term_file)
+        term_file.close()
+    else:
+        parse_terms = terms.read_term_file(path)
     result = []
-    with open(path) as f:
-        for line in f:
-            term = terms.from_string(line)
-            words = [str(w) for w in term.args[0].elements]
-            mr = term.args[1]
-            result.append((words, mr))
+    for term in parse_terms:
+        words = [str(w) for w in term.args[0].elements]
+        mr = term.args[1]
+        result.append((words, mr))
     return result
 
 
+def write_binary_geoquery_file(path, examples):
+    parse_terms = (terms.make_complex_term('parse', (
+            terms.List([terms.make_atom(w) for w in words]), mr))
+            for words, mr in examples)
+    termfiles.write_term_file(path, parse_terms)
+
+
 def read_oracle_file(path):
+    if termfiles.is_term_file(path):
+        term_file = termfiles.TermFile(path)
+        result = [oracle_from_tokens(term_file.tokens(i)) for i in range(len(term_file))]
+        term_file.close()
+        return result
     result = []
     with open(path) as f:
         for line in f:
@@ -26,14 +62,69 @@ def read_oracle_file(path):
     return result
 
 
+def write_binary_oracle_file(path, oracles):
+    termfiles.write_term_file(path, (oracle_to_term(words, actions)
+            for words, actions in oracles))
+
+
+def oracle_to_term(words, actions):
+    """Represents an oracle as a term.
+
+    For example, the words ['give', 'me', ...] and the actions [('skip',),
+    ('shift', 1, 'city(A)'), ...] become
+    oracle([give,me,...],[skip,shift(1,'city(A)'),...]). Strings in actions
+    become atoms, so they need not be parsed or serialized again.
+    """
+    action_terms = []
+    for name, *args in actions:
+        if args:
+            args = [terms.make_number(a) if isinstance(a, int) else terms.make_atom(a)
+                    for a in args]
+            action_terms.append(terms.make_complex_term(name, args))
+        else:
+            action_terms.append(terms.make_atom(name))
+    return terms.make_complex_term('oracle', (
+            terms.List([terms.make_atom(w) for w in words]),
+            terms.List(action_terms)))
+
+
+def oracle_from_tokens(tokens):
+    """Inverse of oracle_to_term, working directly on its canonical key.
+    """
+    tokens = iter(tokens)
+    next(tokens) # oracle/2
+    _, num_words = next(tokens)
+    words = [name for _, name in itertools.islice(tokens, num_words)]
+    _, num_actions = next(tokens)
+    actions = []
+    for _ in range(num_actions):
+        kind, value = next(tokens)
+        if kind == '\'': # action without arguments, stored as an atom
+            actions.append((value,))
+        else: # kind is the action name, value the number of arguments
+            args = tuple(arg for _, arg in itertools.islice(tokens, value))
+            actions.append((kind,) + args)
+    return words, actions
+
+
+def _compiled(path):
+    # Returns the path of the compiled version of a data file if there is an
+    # up-to-date one, otherwise the path itself.
+    compiled_path = path + '.bin'
+    if os.path.exists(compiled_path) \
+            and os.path.getmtime(compiled_path) >= os.path.getmtime(path):
+        return compiled_path
+    return path
+
+
 def geo880_train():
     path = os.path.join(os.path.dirname(__file__), 'data', 'geo880-train')
-    return read_geoquery_file(path)
+    return read_geoquery_file(_compiled(path))
 
  
 def geo880_test():
     path = os.path.join(os.path.dirname(__file__), 'data', 'geo880-test')
-    return read_geoquery_file(path)
+    return read_geoquery_file(_compiled(path))
 
 
 def geo880_train_val():
@@ -42,9 +133,19 @@ def geo880_train_val():
     Includes 60 validation examples and 539 training oracles.
     """
     examples = geo880_train()
-    oracles = read_oracle_file('oracles.json')
+    oracles = read_oracle_file(_compiled('oracles.json'))
     combined = list(zip(examples, oracles))
     random.shuffle(combined)
     val_examples = [example for example, oracle in combined[:60]]
     train_oracles = [oracle for example, oracle in combined[60:]]
     return train_oracles, val_examples
+
+
+if __name__ == '__main__':
+    kind, input_path, output_path = sys.argv[1:]
+    if kind == 'geoquery':
+        write_binary_geoquery_file(output_path, read_geoquery_file(input_path))
+    elif kind == 'oracles':
+        write_binary_oracle_file(output_path, read_oracle_file(input_path))
+    else:
+        sys.exit('usage: python3 -m data geoquery|oracles INPUT OUTPUT')
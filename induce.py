@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+
+"""Induces a lexicon from training data.
+
+For every example, the n-grams of the words (up to config.MAX_TOKEN_LENGTH
+tokens) and the lexical subterms of the MR (see lexicon.lexical_subterms) are
+counted, as well as their co-occurrences, each at most once per example.
+Every pair of an n-gram and a lexical subterm that co-occur often enough is
+scored with the Dice coefficient
+
+    2 * count(ngram, lst) / (count(ngram) + count(lst))
+
+and the pairs scoring above a threshold become lexicon entries. The output
+file can be read with lexicon.read_lexicon. Run
+
+    python3 -m induce [OPTIONS] OUTPUT
+
+to induce a lexicon from geo880-train, see --help for options.
+
+Counting is split into shards that are counted by a pool of worker processes.
+The counts of the shards are then merged. Each worker only holds the n-grams
+and lexical subterms of one example at a time besides its counts, which grow
+with the number of distinct n-grams, lexical subterms and pairs. The main
+process, however, holds the whole corpus (as words and canonical keys of MRs)
+while counting, so its memory also grows with the corpus size. The time taken
+by each phase is reported on standard error.
+"""
+
+
+import argparse
+import collections
+import config
+import contextlib
+import data
+import lexicon
+import multiprocessing
+import sys
+import terms
+import time
+import util
+
+
+class Counts:
+    """Counts of n-grams, lexical subterms and their co-occurrences.
+
+    Lexical subterms are represented by their canonical keys. Counts of
+    different parts of a corpus can be merged.
+    """
+
+    def __init__(self):
+        self.examples = 0
+        self.ngrams = collections.Counter()
+        self.lsts = collections.Counter()
+        self.pairs = collections.Counter()
+
+    def add_example(self, words, mr, max_length=config.MAX_TOKEN_LENGTH):
+        ngrams = set(ngram for length in range(1, max_length + 1)
+                for ngram in util.ngrams(length, tuple(words)))
+        # Lexicon files separate tokens with commas:
+        ngrams = set(ngram for ngram in ngrams if not any(',' in t for t in ngram))
+        lsts = set(l.canonical_key() for l in lexicon.lexical_subterms(mr))
+        self.examples += 1
+        self.ngrams.update(ngrams)
+        self.lsts.update(lsts)
+        self.pairs.update((ngram, l) for ngram in ngrams for l in lsts)
+
+    def merge(self, other):
+        """Adds the counts of other to these counts.
+        """
+        self.examples += other.examples
+        self.ngrams.update(other.ngrams)
+        self.lsts.update(other.lsts)
+        self.pairs.update(other.pairs)
+        return self
+
+
+def count_shard(shard):
+    """Counts a list of examples, given as words and canonical keys of MRs.
+    """
+    examples, max_length = shard
+    counts = Counts()
+    for words, key in examples:
+        counts.add_example(words, terms.from_tokens(key), max_length)
+    return counts
+
+
+def count(examples, processes=None, shard_size=100, max_length=config.MAX_TOKEN_LENGTH):
+    """Counts examples (pairs of words and MR) with a pool of processes.
+
+    MRs are sent to the workers as canonical keys, which are cheaper to pickle
+    than terms. If processes is 1, everything is counted in this process.
+    """
+    examples = [(tuple(words), body(mr).canonical_key()) for words, mr in examples]
+    shards = [(examples[i:i + shard_size], max_length)
+            for i in range(0, len(examples), shard_size)]
+    counts = Counts()
+    if processes == 1:
+        for shard in shards:
+            counts.merge(count_shard(shard))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            for shard_counts in pool.imap_unordered(count_shard, shards):
+                counts.merge(shard_counts)
+    return counts
+
+
+def body(mr):
+    """Strips answer/2 from an MR, as it is not expressed by any words.
+    """
+    if isinstance(mr, terms.ComplexTerm) and mr.functor_name == 'answer' \
+            and len(mr.args) == 2:
+        return mr.args[1]
+    return mr
+
+
+def score(counts, min_count=2, threshold=0.3):
+    """Scores the candidate entries.
+
+    Returns a list of (score, ngram, key) triples for the pairs that occur in
+    at least min_count examples and score at least threshold, best first.
+    """
+    entries = []
+    for (ngram, key), pair_count in counts.pairs.items():
+        if pair_count < min_count:
+            continue
+        dice = 2 * pair_count / (counts.ngrams[ngram] + counts.lsts[key])
+        if dice >= threshold:
+            entries.append((dice, ngram, key))
+    entries.sort(key=lambda e: (-e[0], e[1], terms.from_tokens(e[2]).to_string()))
+    return entries
+
+
+def write_lexicon(path, entries):
+    with open(path, 'w') as f:
+        print('# induced lexicon: term, then comma-separated tokens', file=f)
+        for dice, ngram, key in entries:
+            print('# {:.3f}'.format(dice), file=f)
+            print(terms.from_tokens(key).to_string(), ','.join(ngram), file=f)
+
+
+@contextlib.contextmanager
+def phase(name):
+    start = time.perf_counter()
+    yield
+    print('{:<10} {:>8.3f} s'.format(name, time.perf_counter() - start),
+            file=sys.stderr)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Induce a lexicon from geo880-train.')
+    arg_parser.add_argument('output', help='path of the lexicon file to write')
+    arg_parser.add_argument('--processes', type=int, default=None,
+            help='number of worker processes (default: number of CPUs)')
+    arg_parser.add_argument('--shard-size', type=int, default=100,
+            help='number of examples counted by a worker at a time')
+    arg_parser.add_argument('--min-count', type=int, default=2,
+            help='minimum number of examples with an entry')
+    arg_parser.add_argument('--threshold', type=float, default=0.3,
+            help='minimum Dice coefficient of an entry')
+    args = arg_parser.parse_args()
+    with phase('read'):
+        examples = data.geo880_train()
+    with phase('count'):
+        counts = count(examples, args.processes, args.shard_size)
+    with phase('score'):
+        entries = score(counts, args.min_count, args.threshold)
+    with phase('write'):
+        write_lexicon(args.output, entries)
+    print('{} examples, {} n-grams, {} lexical subterms, {} pairs, {} entries'.format(
+            counts.examples, len(counts.ngrams), len(counts.lsts),
+            len(counts.pairs), len(entries)), file=sys.stderr)
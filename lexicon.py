@@ -1,31 +1,215 @@
+"""The lexicon maps words and multiwords to their possible meanings.
+
+A lexicon is read from a text file with one entry per line: a term, followed by
+whitespace and the comma-separated tokens of the (multi)word. The terms of a
+(multi)word are parsed when it is first looked up and stored as templates.
+Templates are shared, so they must not be used as parts of larger terms:
+lexicon.meanings returns fresh copies of them, lexicon.templates and
+lexicon.spans the templates themselves, e.g. for comparing them with other
+terms.
+
+Compiled Lexicons
+=================
+
+Parsing the lexicon takes much longer than starting a short-lived worker
+process otherwise would, so load_lexicon keeps a compiled copy of a lexicon
+file at path + '.pickle', with the canonical keys of the templates, from
+which terms are built faster than by parsing, again on first lookup. The
+compiled copy records the modification time, size and SHA-256 hash of the
+text file. If the modification time and size are unchanged, it is used
+without reading the text file. Otherwise, it is still used if the hash is
+unchanged, and rebuilt if not, or if it cannot be loaded at all. Within a
+process, load_lexicon also returns the same Lexicon object as long as the
+file does not change.
+"""
+
+
 import collections
+import hashlib
 import os
+import pickle
+import tempfile
 import terms
 
 
+# Increase when changing the format of compiled lexicons:
+COMPILED_VERSION = 2
+
+
 def read_lexicon(path):
-    word_term_map = collections.defaultdict(list)
     with open(path) as f:
-        for line in f:
-            if not line.split() or line.startswith('#'):
-                continue
-            mr, word = line.rsplit(maxsplit=1)
-            tokens = tuple(word.split(','))
-            word_term_map[tokens].append(mr)
-    return Lexicon(word_term_map)
+        return Lexicon(parse_lexicon(f))
+
+
+def parse_lexicon(lines):
+    """Maps the (multi)words in the lines of a lexicon file to their MR strings.
+    """
+    word_term_map = {}
+    for line in lines:
+        if not line.split() or line.startswith('#'):
+            continue
+        mr, word = line.rsplit(maxsplit=1)
+        tokens = tuple(word.split(','))
+        word_term_map.setdefault(tokens, []).append(mr)
+    return word_term_map
+
+
+_loaded = {}
+
+
+def load_lexicon(path):
+    """Like read_lexicon, but uses and updates the compiled lexicon.
+    """
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if path in _loaded and _loaded[path][0] == stamp:
+        return _loaded[path][1]
+    compiled_path = path + '.pickle'
+    try:
+        with open(compiled_path, 'rb') as f:
+            compiled = pickle.load(f)
+        if compiled['version'] != COMPILED_VERSION:
+            compiled = None
+    except Exception:
+        # Missing, truncated or written by an incompatible version of this
+        # module, so rebuild it:
+        compiled = None
+    lex = None
+    if compiled is not None and compiled['stamp'] == stamp:
+        lex = Lexicon(compiled['words'], compiled['keys'])
+    else:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if compiled is not None and compiled['digest'] == digest:
+            lex = Lexicon(compiled['words'], compiled['keys'])
+            compiled['stamp'] = stamp
+            _write_compiled(compiled_path, compiled)
+        else:
+            lex = read_lexicon(path)
+            _write_compiled(compiled_path, {
+                'version': COMPILED_VERSION,
+                'stamp': stamp,
+                'digest': digest,
+                'words': lex.word_term_map,
+                'keys': {word: tuple(t.canonical_key() for t in lex.templates(word))
+                        for word in lex.word_term_map},
+            })
+    _loaded[path] = (stamp, lex)
+    return lex
+
+
+def _write_compiled(compiled_path, compiled):
+    # Write to a temporary file first so that concurrent processes never see
+    # a partial file. If the directory is not writable, just don't cache.
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(compiled_path) or '.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(compiled, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, compiled_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
 
 
 class Lexicon:
+    """A lexicon, see above.
+
+    word_term_map maps (multi)words to lists of MR strings. If given,
+    word_key_map maps them to the canonical keys of the same MRs, from which
+    the templates are then built instead.
+    """
 
-    def __init__(self, word_term_map):
+    def __init__(self, word_term_map, word_key_map=None):
         self.word_term_map = word_term_map
+        self.word_key_map = word_key_map
+        # Templates of the (multi)words looked up so far:
+        self.word_template_map = {}
+        # Token trie: each node maps tokens to child nodes, and None to the
+        # (multi)word ending at the node, if any.
+        self.trie = {}
+        for word in word_term_map:
+            node = self.trie
+            for token in word:
+                node = node.setdefault(token, {})
+            node[None] = word
 
     def meanings(self, word):
         """Returns the known meanings of a word.
+
+        The meanings are new terms, i.e., they have new variables.
+        """
+        return tuple(instantiate(t) for t in self.templates(word))
+
+    def templates(self, word):
+        """Returns the known meanings of a word as shared templates.
+        """
+        templates = self.word_template_map.get(word)
+        if templates is None:
+            if word not in self.word_term_map:
+                return ()
+            if self.word_key_map is None:
+                templates = tuple(terms.from_string(mr) for mr in self.word_term_map[word])
+            else:
+                templates = tuple(terms.from_tokens(key) for key in self.word_key_map[word])
+            self.word_template_map[word] = templates
+        return templates
+
+    def spans(self, words, max_length=None):
+        """Finds all (multi)words in a sequence of words.
+
+        Generates tuples (start, end, template) where words[start:end] is a
+        (multi)word in the lexicon and template is one of its meanings,
+        ordered by start, then by end. Multiwords longer than max_length are
+        ignored.
         """
-        if word in self.word_term_map:
-            return (terms.from_string(s) for s in self.word_term_map[word])
-        return ()
+        words = tuple(words)
+        for start in range(len(words)):
+            node = self.trie
+            end = start
+            while end < len(words) and (max_length is None or end - start < max_length):
+                node = node.get(words[end])
+                if node is None:
+                    break
+                end += 1
+                if None in node:
+                    for template in self.templates(node[None]):
+                        yield start, end, template
+
+
+class Lattice:
+    """All (multi)words of a sentence with their meanings.
+
+    lex is a Lexicon or an AugmentingLexicon. spans is the list of all
+    (start, end, template) tuples found by lex.spans(words, max_length), and
+    starting_at[i] the list of (end, template) tuples of the spans starting at
+    i, e.g. for generating shift actions at queue offset i. suffix_counts[i]
+    counts the canonical keys of the meanings of all spans starting at or
+    after i.
+    """
+
+    def __init__(self, lex, words, max_length=None):
+        self.words = tuple(words)
+        self.spans = list(lex.spans(self.words, max_length))
+        self.starting_at = [[] for _ in range(len(self.words) + 1)]
+        for start, end, template in self.spans:
+            self.starting_at[start].append((end, template))
+        self.suffix_counts = [collections.Counter()]
+        for spans in reversed(self.starting_at[:-1]):
+            counts = self.suffix_counts[-1].copy()
+            counts.update(template.canonical_key() for _, template in spans)
+            self.suffix_counts.append(counts)
+        self.suffix_counts.reverse()
+
+
+def instantiate(template):
+    """Returns a copy of a template term with new variables.
+    """
+    if template.ground:
+        return template
+    return terms.from_tokens(template.canonical_key())
 
 
 def lexical_subterms(term):
@@ -46,7 +230,7 @@ def lexical_subterms(term):
                     args.append(terms.Variable())
                 else:
                     args.append(arg)
-            yield terms.ComplexTerm(term.functor_name, args)
+            yield terms.make_complex_term(term.functor_name, args)
     elif isinstance(term, terms.ConjunctiveTerm):
         for conjunct in term.conjuncts:
             yield from lexical_subterms(conjunct)
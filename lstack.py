@@ -7,45 +7,65 @@ queue of the parse item.
 
 The "head" of a nonempty linked stack is its first element. Its "tail" is the
 linked stack with all the other elements.
+
+Every linked stack knows its length, so len is O(1). Iteration and indexing
+walk the stack in a loop rather than recursively, so stacks can be longer than
+the recursion limit. Linked stacks compare (and hash) by identity; compare
+tuple(stack) to compare elements.
 """
 
 
-def stack(elements=()):
+def stack(elements=(), tail=None):
     """Creates a new stack with the elements in the given sequence.
+
+    If tail is given, the elements are added on top of it, so the new stack
+    shares tail with other stacks that have it.
     """
-    it = iter(elements)
-    try:
-        head = next(it)
-        tail = stack(it)
-        return _NonEmptyLinkedStack(head, tail)
-    except StopIteration:
-        return _EMPTY_LINKED_STACK
+    if tail is None:
+        tail = _EMPTY_LINKED_STACK
+    for element in reversed(tuple(elements)):
+        tail = _NonEmptyLinkedStack(element, tail)
+    return tail
 
 
 class LinkedStack:
 
+    __slots__ = ()
+
     def push(self, element):
         """Returns a new linked stack with element added at the beginning.
         """
         return _NonEmptyLinkedStack(element, self)
 
+    def __len__(self):
+        return self.length
+
     def __getitem__(self, index):
-        if index == 0:
-            return self.head
-        return self.tail[index - 1]
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        s = self
+        for _ in range(index):
+            s = s.tail
+        return s.head
+
+    def __iter__(self):
+        s = self
+        for _ in range(self.length):
+            yield s.head
+            s = s.tail
 
 
 class _EmptyLinkedStack(LinkedStack):
 
+    __slots__ = ()
+    length = 0
+
     def is_empty(self):
         return True
 
     def pop(self):
         raise IndexError()
 
-    def __len__(self):
-        return 0
-
     @property
     def head(self):
         raise IndexError()
@@ -54,20 +74,18 @@ class _EmptyLinkedStack(LinkedStack):
     def tail(self):
         raise IndexError()
 
-    def __iter__(self):
-        # This is how you define an empty generator function:
-        return
-        yield
-
 
 _EMPTY_LINKED_STACK = _EmptyLinkedStack()
 
 
 class _NonEmptyLinkedStack(LinkedStack):
 
+    __slots__ = ('head', 'tail', 'length')
+
     def __init__(self, head, tail):
         self.head = head
         self.tail = tail
+        self.length = tail.length + 1
 
     def is_empty(self):
         return False
@@ -75,10 +93,3 @@ class _NonEmptyLinkedStack(LinkedStack):
     def pop(self):
         """Returns the tail of this linked stack."""
         return self.tail
-
-    def __len__(self):
-        return 1 + len(self.tail)
-
-    def __iter__(self):
-        yield self.head
-        yield from self.tail
@@ -1,4 +1,36 @@
+"""Models for scoring parse items.
+
+Perceptron stores its weights in Counters keyed by the features themselves.
+VectorPerceptron maps features to integer IDs, either through a feature
+dictionary or by hashing them into a fixed number of IDs, and stores weights,
+totals and timestamps in NumPy arrays, so a whole agenda can be scored at
+once with score_batch. In dictionary mode, it computes exactly the same scores
+as Perceptron. Use new_model to create the model selected in config.
+"""
+
+
 import collections
+import config
+import functools
+import hashlib
+import numpy as np
+import termarrays
+
+
+def new_model(kind=None):
+    """Returns a new model of the given kind (default: config.MODEL).
+
+    kind is 'perceptron', 'dictionary' or 'hashing'.
+    """
+    if kind is None:
+        kind = config.MODEL
+    if kind == 'perceptron':
+        return Perceptron()
+    if kind == 'dictionary':
+        return VectorPerceptron()
+    if kind == 'hashing':
+        return VectorPerceptron(hashing=True, size=config.HASHING_SIZE)
+    raise ValueError('unknown model: ' + kind)
 
 
 class Perceptron:
@@ -15,6 +47,9 @@ class Perceptron:
             result += self.weights.get(feature, 0.0)
         return result
 
+    def score_batch(self, feature_lists):
+        return [self.score(features) for features in feature_lists]
+
     def update(self, correct_features, predicted_features):
         self.update_counter += 1
         update = collections.Counter()
@@ -36,3 +71,98 @@ class Perceptron:
 
     def copy(self):
         return Perceptron(self.update_counter, self.weights, self.totals, self.timestamps)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _hash_feature(feature, size):
+    # Python's hash of strings differs between processes, so hash repr:
+    digest = hashlib.blake2b(repr(feature).encode('utf-8'), digest_size=8).digest()
+    return 1 + int.from_bytes(digest, 'little') % (size - 1)
+
+
+class VectorPerceptron:
+    """A perceptron with integer feature IDs and NumPy arrays.
+
+    With hashing=False, features get consecutive IDs the first time they
+    occur in an update. With hashing=True, the ID of a feature is a hash of
+    its repr into range(1, size), so features should be strings, numbers or
+    tuples of these. Features that share an ID share a weight. ID 0 is for
+    features without an ID, whose weight is always 0.
+    """
+
+    def __init__(self, hashing=False, size=1024):
+        self.hashing = hashing
+        self.size = size
+        self.feature_ids = {}
+        self.update_counter = 0
+        self.weights = np.zeros(size, dtype=np.float64)
+        self.totals = np.zeros(size, dtype=np.float64)
+        self.timestamps = np.zeros(size, dtype=np.int64)
+
+    def ids(self, features, add=False):
+        """Returns the IDs of features, as a list.
+
+        In dictionary mode, new features get new IDs if add is True, else ID 0.
+        """
+        if self.hashing:
+            return [_hash_feature(f, self.size) for f in features]
+        if not add:
+            get = self.feature_ids.get
+            return [get(f, 0) for f in features]
+        result = []
+        for f in features:
+            if f not in self.feature_ids:
+                self.feature_ids[f] = len(self.feature_ids) + 1
+                if len(self.feature_ids) >= len(self.weights):
+                    self._grow()
+            result.append(self.feature_ids[f])
+        return result
+
+    def _grow(self):
+        for name in ('weights', 'totals', 'timestamps'):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate((array, np.zeros_like(array))))
+
+    def score(self, features):
+        return float(self.score_batch((features,))[0])
+
+    def score_batch(self, feature_lists):
+        """Scores a list of feature lists at once, returns an array of scores.
+        """
+        batch = termarrays.make_batch(self.ids(features) for features in feature_lists)
+        matrix = self.weights[batch.matrix(fill=0)]
+        # Add up column by column, so each score is summed in feature order,
+        # exactly like Perceptron.score:
+        result = np.zeros(len(batch), dtype=np.float64)
+        for column in matrix.T:
+            result += column
+        return result
+
+    def update(self, correct_features, predicted_features):
+        self.update_counter += 1
+        update = collections.Counter()
+        for cf in self.ids(correct_features, add=True):
+            update[cf] += 1
+        for pf in self.ids(predicted_features, add=True):
+            update[pf] -= 1
+        changed = [(f, delta) for f, delta in update.items() if delta != 0]
+        ids = np.array([f for f, _ in changed], dtype=np.int64)
+        deltas = np.array([delta for _, delta in changed], dtype=np.float64)
+        self.totals[ids] += (self.update_counter - self.timestamps[ids]) * self.weights[ids]
+        self.timestamps[ids] = self.update_counter
+        self.weights[ids] += deltas
+
+    def average_weights(self):
+        ids = np.flatnonzero(self.timestamps)
+        self.totals[ids] += (self.update_counter - self.timestamps[ids]) * self.weights[ids]
+        self.timestamps[ids] = self.update_counter
+        self.weights[ids] = self.totals[ids] / self.timestamps[ids]
+
+    def copy(self):
+        result = VectorPerceptron(self.hashing, self.size)
+        result.feature_ids = dict(self.feature_ids)
+        result.update_counter = self.update_counter
+        result.weights = self.weights.copy()
+        result.totals = self.totals.copy()
+        result.timestamps = self.timestamps.copy()
+        return result
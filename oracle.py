@@ -1,36 +1,86 @@
+import array
 import augment
 import collections
 import config
+import heapq
+import itertools
 import lexicon
 import parseitems
 import random
+import seensets
+import termarrays
+import terms
+import time
+import tracemalloc
 import util
 
 
-def initial_beam(words, target_mr, lex):
+# Increase when changing the search so that it may find different action
+# sequences, to invalidate cached oracles (see oracles.OracleCache):
+VERSION = 1
+
+
+def initial_beam(words, target_mr, lex, seen=None, trace=None):
     items = [parseitems.initial(words)]
-    rejector = Rejector(target_mr, lex)
-    seen = set()
-    return Beam(items, rejector, seen, lex)
+    lattice = lexicon.Lattice(lex, words, config.MAX_TOKEN_LENGTH)
+    rejector = Rejector(target_mr, lattice)
+    if seen is None:
+        seen = seensets.SeenSet(config.SEEN_SET, config.SEEN_SCOPE,
+                capacity=config.SEEN_BLOOM_CAPACITY,
+                error_rate=config.SEEN_BLOOM_ERROR_RATE)
+    symbols = termarrays.SymbolTable()
+    return Beam(items, rejector, seen, lex, symbols, trace)
 
 
 class Beam:
 
-    def __init__(self, items, rejector, seen, lex):
+    def __init__(self, items, rejector, seen, lex, symbols, trace=None):
         self.items = items
         self.rejector = rejector
         self.seen = seen
         self.lex = lex
+        # The keys in seen are encoded with these symbols:
+        self.symbols = symbols
+        # Records the steps if instrumentation is on:
+        self.trace = NO_TRACE if trace is None else trace
 
     def next(self):
+        self.seen.step(self.items)
+        step = self.trace.new_step(len(self.items))
         next_items = []
         for item in self.items:
-            successors = item.successors(self.lex)
-            successors = [s for s in successors if self.check_rejector(s)]
-            successors = [s for s in successors if self.check_siblings(s, successors)]
-            successors = [s for s in successors if self.check_seen(s)]
-            next_items.extend(successors)
-        return Beam(next_items, self.rejector, self.seen, self.lex)
+            next_items.extend(self.expand(item, step))
+        clock = self.trace.clock
+        start = clock()
+        unseen = self.check_seen(next_items)
+        step['seen_time'] += clock() - start
+        result = [s for s, u in zip(next_items, unseen) if u]
+        step['seen'] += len(next_items) - len(result)
+        return Beam(result, self.rejector, self.seen, self.lex, self.symbols, self.trace)
+
+    def expand(self, item, step=None):
+        """Returns the successors of item that pass the rejector and sibling checks.
+
+        If step is a step of self.trace, the numbers of successors and of
+        pruned successors and the time taken are added to it.
+        """
+        if step is None:
+            step = _NO_STEP
+        clock = self.trace.clock
+        start = clock()
+        successors = list(item.successors(self.lex))
+        rejector_start = clock()
+        accepted = [s for s in successors if self.check_rejector(s)]
+        siblings_start = clock()
+        kept = [s for s in accepted if self.check_siblings(s, accepted)]
+        end = clock()
+        step['successors'] += len(successors)
+        step['rejector'] += len(successors) - len(accepted)
+        step['siblings'] += len(accepted) - len(kept)
+        step['successors_time'] += rejector_start - start
+        step['rejector_time'] += siblings_start - rejector_start
+        step['siblings_time'] += end - siblings_start
+        return kept
 
     def check_rejector(self, item):
         return not self.rejector.reject(item)
@@ -52,61 +102,275 @@ class Beam:
             return False
         return True
 
-    def check_seen(self, item):
-        if item.action[0] == 'idle':
-            return True
-        string = str(item)
-        if string in self.seen:
-            return False
-        self.seen.add(string)
-        return True
+    def check_seen(self, items):
+        """Checks a batch of items for duplicates.
+
+        Returns a list of booleans, False for items equivalent to an earlier
+        one in the batch or one that self.seen remembers. Since the items
+        are added to self.seen in order, it also finds the duplicates
+        within the batch (see bench.seen_keys).
+        """
+        result = [True] * len(items)
+        for i, item in enumerate(items):
+            if item.action[0] == 'idle':
+                continue
+            key = array.array('q', item_codes(item, self.symbols)).tobytes()
+            if not self.seen.add(key, item.offset):
+                result[i] = False
+        return result
 
 
 class Rejector:
 
-    def __init__(self, target_mr, lex):
+    def __init__(self, target_mr, lattice):
         self.target_mr = target_mr
-        self.fragments = list(f for s in target_mr.subterms() for f in s.fragments())
-        self.lsts = collections.Counter(l.to_string() for l in lexicon.lexical_subterms(target_mr))
-        self.lex = lex
+        self.fragments = terms.FragmentIndex(target_mr)
+        self.lsts = collections.Counter(l.canonical_key() for l in lexicon.lexical_subterms(target_mr))
+        self.lattice = lattice
 
     def reject(self, item):
         # TODO can only drop/lift/sdrop something that already has all variable bindings with its environment??
         if item.finished:
-            return not item.stack.head.mr.equivalent(self.target_mr)
+            return item.stack.head.mr.canonical_key() != self.target_mr.canonical_key()
         # predicate bag check
-        stack_lsts = collections.Counter(l.to_string() for se in item.stack for l in lexicon.lexical_subterms(se.mr))
+        states = [self.element_state(se) for se in item.stack]
+        stack_lsts = collections.Counter()
+        for state in states:
+            stack_lsts.update(state.lsts)
         if not util.issubset(stack_lsts, self.lsts):
             return True
-        queue_lsts = collections.Counter(meaning.to_string() for length in range(1, config.MAX_TOKEN_LENGTH + 1) for word in util.ngrams(length, tuple(item.words[item.offset:])) for meaning in self.lex.meanings(word))
-        if not util.issubset(self.lsts, stack_lsts + queue_lsts):
+        # Can the stack and the rest of the queue still supply all predicates?
+        queue_lsts = self.lattice.suffix_counts[item.offset]
+        if any(count > stack_lsts[l] + queue_lsts[l] for l, count in self.lsts.items()):
             return True
         # fragment check (false negatives (and positives?) unless mr is augmented!)
-        fragments = tuple(find_fragment(se.mr, self.fragments) for se in item.stack)
+        # Each element's MR must be equivalent to a fragment of the target,
+        # and variables shared between elements must correspond to the same
+        # variables in the fragments:
         bindings = {}
-        for se, fr in zip(item.stack, fragments):
-            if not se.mr.subsumes(fr, bindings):
+        for state in states:
+            if state.bindings is None:
+                state.match(self.fragments)
+            if state.fragment is None:
                 return True
+            for var, value in state.bindings.items():
+                if bindings.setdefault(var, value) is not value:
+                    return True
         return False
 
+    def element_state(self, se):
+        """Returns the ElementState of a stack element, computing it if needed.
+        """
+        state = se.rejector_state
+        if state is None or state.rejector is not self or state.mr is not se.mr:
+            state = ElementState(self, se.mr)
+            se.rejector_state = state
+        return state
+
+    def estimate(self, item):
+        """Returns a lower bound on the number of actions needed to finish item.
+
+        Each remaining word needs a skip or shift action, and one shift
+        consumes at most config.MAX_TOKEN_LENGTH words. Each missing lexical
+        subterm of the target needs a shift (the meanings of an
+        AugmentingLexicon are single lexical subterms). All stack elements,
+        including the new ones, must be combined into one, each combination
+        taking one action. Finally, the item needs to be finished. Only
+        valid for items that the rejector does not reject.
+        """
+        if item.finished:
+            return 0
+        remaining_words = len(item.words) - item.offset
+        stack_size = len(item.stack)
+        stack_lsts = sum(self.element_state(se).num_lsts for se in item.stack)
+        missing_lsts = sum(self.lsts.values()) - stack_lsts
+        word_actions = -(-remaining_words // config.MAX_TOKEN_LENGTH)
+        return max(word_actions, missing_lsts) + max(stack_size + missing_lsts - 1, 0) + 1
+
+
+class ElementState:
+    """What a Rejector knows about one stack element.
+
+    Stored in the element's rejector_state, so it is carried forward to the
+    successors of an item along with the unchanged stack elements, and only
+    computed for new ones. lsts counts the canonical keys of the lexical
+    subterms of the element's MR. The fragment of the target equivalent to
+    the MR (or None) and the bindings of the MR's variables to the fragment's
+    are only computed by match, when needed.
+    """
+
+    __slots__ = ('rejector', 'mr', 'lsts', 'num_lsts', 'fragment', 'bindings')
+
+    def __init__(self, rejector, mr):
+        self.rejector = rejector
+        self.mr = mr
+        self.lsts = collections.Counter(l.canonical_key() for l in lexicon.lexical_subterms(mr))
+        self.num_lsts = sum(self.lsts.values())
+        self.fragment = None
+        self.bindings = None
+
+    def match(self, fragment_index):
+        self.fragment = fragment_index.find(self.mr)
+        self.bindings = {}
+        if self.fragment is not None:
+            terms.subsumes_all(((self.mr, self.fragment),), self.bindings)
+
+
+def item_codes(item, symbols):
+    """Encodes the state of a parse item as a list of integers.
+
+    Items with equivalent stacks (including secondary stacks) and the same
+    queue offset get the same codes. The stack MRs are encoded jointly with
+    the given termarrays.SymbolTable, after a length-prefixed header with the
+    offset and the secondary stacks.
+    """
+    stack = tuple(item.stack)
+    codes = [item.offset, int(item.finished), len(stack)]
+    for se in stack:
+        secstack = tuple(se.secstack)
+        codes.append(len(secstack))
+        for address in secstack:
+            codes.append(len(address))
+            codes.extend(address)
+    mrs_key = terms.joint_canonical_key(tuple(se.mr for se in stack))
+    codes.extend(symbols.encode_tokens(mrs_key))
+    return codes
+
+
+class Trace:
+    """Instrumentation of a breadth-first oracle search.
+
+    steps has a Counter for each step, with the beam size ('beam'), the number
+    of successors of the items in the beam ('successors'), the numbers of
+    successors pruned by the rejector, sibling and duplicate checks
+    ('rejector', 'siblings', 'seen'), and the seconds taken by each of these
+    ('successors_time', 'rejector_time', 'siblings_time', 'seen_time').
+    If memory is true, peak_memory is set to the peak memory in bytes
+    allocated during the search. Tracing memory slows down the search a lot,
+    and not evenly, so times are only meaningful if memory is false.
+    """
+
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, memory=False):
+        self.steps = []
+        self.memory = memory
+        self.peak_memory = None
+
+    def new_step(self, beam_size):
+        step = collections.Counter(beam=beam_size)
+        self.steps.append(step)
+        return step
+
+    def totals(self):
+        """Returns a Counter with the sums over all steps.
+        """
+        totals = collections.Counter()
+        for step in self.steps:
+            totals.update(step)
+        return totals
+
+
+class _NoStep:
+    # Stands in for the Counter of a step, ignoring updates.
+
+    def __getitem__(self, key):
+        return 0
+
+    def __setitem__(self, key, value):
+        pass
 
-def find_fragment(mr, fragments):
-    for fr in fragments:
-        if mr.equivalent(fr):
-            return fr
 
+class _NoTrace:
+    # Stands in for a Trace when instrumentation is off.
 
-def action_sequence(words, target_mr):
+    memory = False
+
+    @staticmethod
+    def clock():
+        return 0
+
+    def new_step(self, beam_size):
+        return _NO_STEP
+
+
+_NO_STEP = _NoStep()
+NO_TRACE = _NoTrace()
+
+
+def action_sequence(words, target_mr, search='bfs', stats=None, seen=None, trace=None):
     """Looks for action sequences that lead from words to target_mr.
 
-    Returns the first that it finds.
+    Returns the first that it finds. search is 'bfs' for breadth-first search
+    or 'astar' for best-first (A*) search ordered by the number of actions so
+    far plus Rejector.estimate, which typically expands far fewer items.
+    seen is the seensets.SeenSet to use, by default one as configured in
+    config. If stats is a Counter, the number of expanded items is added to
+    stats['expanded'], and the peak memory of the seen set in bytes is
+    stored in stats['seen_memory']. If trace is a Trace, each step of a
+    breadth-first search (and the peak memory, if trace.memory is true) are
+    recorded in it.
     """
-    lex = augment.AugmentingLexicon(lexicon.read_lexicon('lexicon.txt'), target_mr)
-    beam = initial_beam(words, target_mr.augment(), lex)
-    while beam.items:
-        #print(len(beam.items), random.choice(beam.items))
-        beam = beam.next()
-        finished = [i for i in beam.items if i.finished]
-        if finished:
-            return finished[0].action_sequence()
+    if stats is None:
+        stats = collections.Counter()
+    lex = augment.AugmentingLexicon(lexicon.load_lexicon('lexicon.txt'), target_mr)
+    beam = initial_beam(words, lex.augmented_mr, lex, seen, trace)
+    seen = beam.seen
+    tracing_memory = trace is not None and trace.memory
+    if tracing_memory:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    try:
+        if search == 'astar':
+            return best_first_search(beam, stats).action_sequence()
+        if search != 'bfs':
+            raise ValueError('unknown search: ' + search)
+        while beam.items:
+            #print(len(beam.items), random.choice(beam.items))
+            stats['expanded'] += len(beam.items)
+            beam = beam.next()
+            finished = [i for i in beam.items if i.finished]
+            if finished:
+                return finished[0].action_sequence()
+        raise ValueError('no action sequence found')
+    finally:
+        stats['seen_memory'] = seen.finish()
+        if tracing_memory:
+            _, trace.peak_memory = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+
+
+def best_first_search(beam, stats):
+    """Searches for a finished item, starting from the items in beam.
+
+    Uses beam for its rejector, sibling and duplicate checks. Items with
+    the same cost are expanded in the order in which they were found.
+
+    The items with the same estimated total cost take the place of a beam
+    for the scope of beam.seen: before expanding the first item with a
+    higher estimate, seen.step is called with all items in the queue, so
+    with 'step' scope, only duplicates among the successors of items with
+    the same estimate are detected, and with 'offset' scope, the sets of
+    offsets smaller than those of all queued items are forgotten.
+    """
+    tiebreaker = itertools.count()
+    queue = [(beam.rejector.estimate(item), 0, next(tiebreaker), item) for item in beam.items]
+    heapq.heapify(queue)
+    step_estimate = None
+    while queue:
+        estimate, cost, _, item = heapq.heappop(queue)
+        if item.finished:
+            return item
+        if step_estimate is None or estimate > step_estimate:
+            step_estimate = estimate
+            beam.seen.step([item] + [entry[3] for entry in queue])
+        stats['expanded'] += 1
+        successors = beam.expand(item)
+        for successor, unseen in zip(successors, beam.check_seen(successors)):
+            if unseen:
+                heapq.heappush(queue, (cost + 1 + beam.rejector.estimate(successor),
+                        cost + 1, next(tiebreaker), successor))
     raise ValueError('no action sequence found')
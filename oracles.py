@@ -1,32 +1,360 @@
 #!/usr/bin/env python3
 
 
+"""Creates oracles (action sequences) for training examples.
+
+Run
+
+    python3 -m oracles [OPTIONS] INPUT OUTPUT
+
+to find an action sequence for each example in the GeoQuery data file INPUT.
+The oracles are written to OUTPUT as JSON lines (see data.read_oracle_file),
+in the order of the examples, each with the index of its example. Examples
+for which no action sequence is found, because the search fails, takes too
+long (--timeout) or runs out of memory (--memory), are written to a failures
+file (OUTPUT.failures by default) instead, so one hard example does not abort
+the whole run.
+
+The examples are processed by a pool of worker processes, which share the
+lexicon loaded before starting them. A worker that dies (e.g., killed by the
+operating system when out of memory) only fails the example it was
+searching, see search_all. Progress and throughput are shown on
+standard error. With --resume, the driver skips the examples whose index is
+already recorded in OUTPUT or the failures file and appends to both, so an
+interrupted run can be resumed. Otherwise, both files are overwritten.
+
+With --cache DIR, the results of the search, including failures, are also
+stored in a content-addressed cache, see OracleCache. OUTPUT and the failures
+file are then rebuilt from the cache for all examples, and only examples whose
+result is not in the cache are searched. So after editing the lexicon, only
+the examples that contain an edited (multi)word are, and an interrupted run
+continues where it stopped. --resume is not needed with a cache and cannot be
+combined with it.
+"""
+
+
+import argparse
 import augment
-import fileinput
+import collections
+import concurrent.futures
+import config
+import data
+import hashlib
+import itertools
 import json
+import lexicon
+import multiprocessing
 import oracle
+import os
+import resource
+import signal
 import sys
+import tempfile
 import terms
+import time
 
 
 def unaugment(action):
     if action[0] == 'shift':
         lst = terms.from_string(action[2])
         if isinstance(lst, terms.ComplexTerm):
-            lst.functor_name = augment.unaugment(lst.functor_name)
+            # Terms may be interned and shared, so build a new one rather
+            # than renaming the functor in place:
+            lst = terms.make_complex_term(augment.unaugment(lst.functor_name), lst.args)
         action = (action[0], action[1], lst.to_string())
     return action
-        
 
 
-if __name__ == '__main__':
-    for line in fileinput.input():
-        term = terms.from_string(line)
-        words = tuple(str(w) for w in term.args[0].elements)
-        mr = term.args[1]
+class Timeout(Exception):
+    pass
+
+
+def raise_timeout(signum, frame):
+    raise Timeout()
+
+
+# Timeout per example in seconds and search mode, set in each worker process:
+_timeout = None
+_search = 'bfs'
+
+
+def _init_worker(timeout, memory, search):
+    global _timeout, _search
+    # Workers ignore ^C, the parent process handles it:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _timeout = timeout
+    _search = search
+    if memory is not None:
+        limit = memory * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def find_oracle(example):
+    """Finds the oracle for one example, given as words and canonical key of MR.
+
+    Returns the action sequence, or None and an error message.
+    """
+    words, key = example
+    timeout = _timeout
+    signal.signal(signal.SIGALRM, raise_timeout)
+    try:
         try:
-            actions = oracle.action_sequence(words, mr)
-        except:
-            print('FAILED:', words)
-            sys.exit(1)
-        print(json.dumps({'words': words, 'actions': [unaugment(a) for a in actions]}))
+            if timeout is not None:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            actions = oracle.action_sequence(words, terms.from_tokens(key), _search)
+        finally:
+            # If the alarm goes off before the timer is cleared, the Timeout
+            # is still caught below:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        return [unaugment(a) for a in actions], None
+    except Timeout:
+        return None, 'timeout after {} s'.format(timeout)
+    except MemoryError:
+        return None, 'out of memory'
+    except Exception as e:
+        return None, '{}: {}'.format(type(e).__name__, e)
+    finally:
+        signal.signal(signal.SIGALRM, signal.SIG_IGN)
+
+
+# Error message for an example whose worker died. Such failures are not
+# cached, as they may be caused by other processes using too much memory.
+WORKER_DIED = 'worker process died'
+
+
+def _new_executor(processes, initargs):
+    # Fork, so the workers share the lexicon loaded by the parent process:
+    return concurrent.futures.ProcessPoolExecutor(processes,
+            multiprocessing.get_context('fork'), _init_worker, initargs)
+
+
+def _search_alone(example, initargs):
+    with _new_executor(1, initargs) as executor:
+        try:
+            return executor.submit(find_oracle, example).result()
+        except concurrent.futures.process.BrokenProcessPool:
+            return None, WORKER_DIED
+
+
+def search_all(examples, processes=None, timeout=None, memory=None, search='bfs'):
+    """Generates the results of find_oracle for examples, in order.
+
+    The examples are searched by a pool of worker processes. A worker that
+    dies, e.g., because it is killed for using too much memory, breaks the
+    pool. The examples the pool was working on are then searched again one
+    at a time, so only the example that kills its worker fails, and the
+    remaining examples are searched by a new pool.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    initargs = (timeout, memory, search)
+    examples = iter(examples)
+    pending = collections.deque()
+    executor = _new_executor(processes, initargs)
+    try:
+        while True:
+            # Keep every worker busy, without submitting all examples at once:
+            for example in itertools.islice(examples, 2 * processes - len(pending)):
+                pending.append((example, executor.submit(find_oracle, example)))
+            if not pending:
+                return
+            try:
+                result = pending[0][1].result()
+            except concurrent.futures.process.BrokenProcessPool:
+                executor.shutdown()
+                for example, _ in pending:
+                    yield _search_alone(example, initargs)
+                pending.clear()
+                executor = _new_executor(processes, initargs)
+                continue
+            pending.popleft()
+            yield result
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+class OracleCache:
+    """A directory of search results, addressed by everything they depend on.
+
+    A result is an action sequence or, if the search failed, an error
+    message. Its key is a hash of the words, the canonical key of the target
+    MR, the lexicon entries for all (multi)words in the sentence, the search
+    algorithm and its version (oracle.VERSION) and settings, and the time and
+    memory limits of the search. The result is stored in DIR/oracles/KEY. Additionally, DIR/examples/EXAMPLE,
+    where EXAMPLE is a hash of only the words and the MR, stores the key of
+    the latest oracle for the example. A miss for an example with an
+    earlier oracle is counted as an invalidation. Only the process that
+    creates the OracleCache should use it.
+    """
+
+    def __init__(self, directory, lex, search, timeout=None, memory=None):
+        self.directory = directory
+        self.lex = lex
+        self.search = search
+        self.timeout = timeout
+        self.memory = memory
+        self.hits = self.misses = self.invalidations = 0
+        for subdirectory in ('oracles', 'examples'):
+            os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+
+    def keys(self, words, mr_key):
+        """Returns the example hash and the oracle key of an example.
+        """
+        example = _hash([words, mr_key])
+        reachable = sorted(set(tuple(words[start:end]) for start, end, _
+                in self.lex.spans(words, config.MAX_TOKEN_LENGTH)))
+        entries = [(w, self.lex.word_term_map[w]) for w in reachable]
+        settings = [oracle.VERSION, self.search, config.MAX_TOKEN_LENGTH,
+                config.SEEN_SET, config.SEEN_SCOPE, config.SEEN_BLOOM_CAPACITY,
+                config.SEEN_BLOOM_ERROR_RATE, self.timeout, self.memory]
+        return example, _hash([example, entries, settings])
+
+    def get(self, words, mr_key):
+        """Returns the cached result for an example, or None.
+
+        A result is an action sequence and None, or None and an error message.
+        """
+        example, key = self.keys(words, mr_key)
+        try:
+            with open(os.path.join(self.directory, 'oracles', key)) as f:
+                result = json.load(f)
+            self.hits += 1
+            return result.get('actions'), result.get('error')
+        except FileNotFoundError:
+            self.misses += 1
+            if os.path.exists(os.path.join(self.directory, 'examples', example)):
+                self.invalidations += 1
+            return None
+
+    def put(self, words, mr_key, actions, error=None):
+        example, key = self.keys(words, mr_key)
+        if actions is None:
+            result = {'error': error}
+        else:
+            result = {'actions': actions}
+        _write_atomically(os.path.join(self.directory, 'oracles', key), json.dumps(result))
+        _write_atomically(os.path.join(self.directory, 'examples', example), key)
+
+    def report(self):
+        return '{} cache hits, {} misses, {} invalidations'.format(
+                self.hits, self.misses, self.invalidations)
+
+
+def _hash(obj):
+    return hashlib.sha256(json.dumps(obj).encode('utf-8')).hexdigest()
+
+
+def _write_atomically(path, text):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _recorded_indices(path):
+    """Returns the example indices recorded in an output or failures file.
+
+    An incomplete last line, left by an interrupted run, is removed.
+    """
+    try:
+        f = open(path, 'rb+')
+    except FileNotFoundError:
+        return set()
+    with f:
+        indices = set()
+        complete = 0
+        for number, line in enumerate(f, start=1):
+            if not line.endswith(b'\n'):
+                break
+            record = json.loads(line)
+            if 'index' not in record:
+                raise ValueError('{}, line {}: no example index, cannot resume'.format(
+                        path, number))
+            indices.add(record['index'])
+            complete += len(line)
+        f.truncate(complete)
+    return indices
+
+
+def _sort_by_index(path):
+    with open(path) as f:
+        lines = f.readlines()
+    lines.sort(key=lambda line: json.loads(line)['index'])
+    _write_atomically(path, ''.join(lines))
+
+
+def create_oracles(input_path, output_path, failures_path, processes=None,
+        timeout=None, memory=None, search='bfs', cache_dir=None, resume=False):
+    if resume and cache_dir is not None:
+        raise ValueError('cannot resume when using a cache')
+    examples = data.read_geoquery_file(input_path)
+    done = set()
+    if resume:
+        done = _recorded_indices(output_path) | _recorded_indices(failures_path)
+    todo = [(index, tuple(words), mr.canonical_key())
+            for index, (words, mr) in enumerate(examples) if index not in done]
+    # Load the lexicon once, before forking, so the workers share it:
+    lex = lexicon.load_lexicon('lexicon.txt')
+    cache = None
+    cached = [None] * len(todo)
+    if cache_dir is not None:
+        cache = OracleCache(cache_dir, lex, search, timeout, memory)
+        cached = [cache.get(words, key) for _, words, key in todo]
+    succeeded = failed = 0
+    start = time.perf_counter()
+    mode = 'a' if resume else 'w'
+    with open(output_path, mode) as output, open(failures_path, mode) as failures:
+        searched = search_all(((words, key) for (_, words, key), result
+                in zip(todo, cached) if result is None),
+                processes, timeout, memory, search)
+        for (index, words, key), result in zip(todo, cached):
+            if result is None:
+                result = next(searched)
+                if cache is not None and result[1] != WORKER_DIED:
+                    cache.put(words, key, *result)
+            actions, error = result
+            if actions is None:
+                print(json.dumps({'index': index, 'words': words, 'error': error}),
+                        file=failures, flush=True)
+                failed += 1
+            else:
+                print(json.dumps({'index': index, 'words': words, 'actions': actions}),
+                        file=output, flush=True)
+                succeeded += 1
+            elapsed = time.perf_counter() - start
+            print('\r{}/{} examples, {} failed, {:.2f} examples/s'.format(
+                    len(done) + succeeded + failed, len(examples), failed,
+                    (succeeded + failed) / elapsed), end='', file=sys.stderr)
+    print(file=sys.stderr)
+    # Resumed runs may have filled gaps:
+    _sort_by_index(output_path)
+    _sort_by_index(failures_path)
+    if cache is not None:
+        print(cache.report(), file=sys.stderr)
+    return succeeded, failed
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Create oracles for training examples.')
+    arg_parser.add_argument('input', help='GeoQuery data file')
+    arg_parser.add_argument('output', help='oracle file to write or resume')
+    arg_parser.add_argument('--failures', help='file for failed examples (default: OUTPUT.failures)')
+    arg_parser.add_argument('--processes', type=int, default=None,
+            help='number of worker processes (default: number of CPUs)')
+    arg_parser.add_argument('--timeout', type=float, default=None,
+            help='maximum number of seconds per example')
+    arg_parser.add_argument('--memory', type=int, default=None,
+            help='maximum size of each worker process in MiB')
+    arg_parser.add_argument('--search', choices=('bfs', 'astar'), default='bfs',
+            help='search algorithm, see oracle.action_sequence')
+    arg_parser.add_argument('--cache', help='directory for caching oracles')
+    arg_parser.add_argument('--resume', action='store_true',
+            help='skip examples already in OUTPUT or the failures file')
+    args = arg_parser.parse_args()
+    if args.resume and args.cache is not None:
+        arg_parser.error('--resume cannot be combined with --cache')
+    failures_path = args.failures
+    if failures_path is None:
+        failures_path = args.output + '.failures'
+    create_oracles(args.input, args.output, failures_path, args.processes,
+            args.timeout, args.memory, args.search, args.cache, args.resume)
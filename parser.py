@@ -1,35 +1,174 @@
+"""Beam-search parser with a perceptron model.
+
+Items on the agenda are wrapped in Hypothesis objects, which compute the
+features and the score of each item only once. If items have an
+action_features method returning the features added by the action that
+created them, scoring is incremental: the features of an item are those of
+its predecessor plus its action features, and since the score of the model
+is a sum over features, its score is the score of its predecessor plus that
+of the action features. Then only the action features of successors are
+extracted and scored, and the features of the predecessors are shared. This
+requires that, along every derivation from the initial item, the
+concatenated action_features() of the items equal the features() of the
+last item.
+Otherwise, each item's features() are extracted and scored in full.
+
+Beam Search
+===========
+
+Parsing and training both use a BeamSearch, which starts from the initial
+item and repeatedly expands all hypotheses in the beam, keeping the best
+ones. Its settings, by default those in config, trade speed for accuracy:
+
+* The beam width is width + width_per_word * (number of words), so it can
+  be fixed (width_per_word = 0) or grow with the length of the sentence.
+* The best hypotheses are selected with heapq.nlargest rather than by
+  sorting all successors.
+* With a margin, hypotheses scoring more than margin below the best one are
+  pruned, even if the beam is not full.
+* With max_steps, the search stops after that many steps. A parse then only
+  succeeds if the beam has a finished item.
+"""
+
+
+import config
+import heapq
+import lstack
 import models
 import parseitems
 import random
 import sys
+import termarrays
 import util
 
 
-def parse(words, lex, model):
-    agenda = [parseitems.initial(words)]
-    while any(not i.finished for i in agenda):
-        agenda = [s for i in agenda for s in i.successors(lex)]
-        agenda.sort(key=lambda i: model.score(i.features()), reverse=True)
-        beam = agenda[:min(10, len(agenda))]
-        agenda = beam
-    if not agenda:
-        raise ValueError('no parse found')
-    return agenda[0].stack[0].mr
+class Hypothesis:
+    """A parse item with its score and (the parts of) its features.
+
+    feature_parts is a linked stack of lists of features, the latest first.
+    When items have action_features, the parts are the action_features() of
+    the items along the derivation, so their concatenation must equal
+    item.features(), or the scores of incremental parsing are wrong.
+    """
 
+    __slots__ = ('item', 'score', 'feature_parts')
 
-def train(train_data, val_data, lex, max_epochs, patience):
+    def __init__(self, item, score, feature_parts):
+        self.item = item
+        self.score = score
+        self.feature_parts = feature_parts
+
+    def features(self):
+        """Returns all features of the item, in the order they were added.
+        """
+        return [f for part in reversed(tuple(self.feature_parts)) for f in part]
+
+
+def initial_hypothesis(words):
+    return Hypothesis(parseitems.initial(words), 0.0, lstack.stack())
+
+
+def expand(hypotheses, lex, model):
+    """Returns the scored successors of hypotheses.
+
+    Scores the new features of all successors with one call to
+    model.score_batch.
+    """
+    successors = []
+    for h in hypotheses:
+        for s in h.item.successors(lex):
+            if s is h.item:
+                successors.append((h, None))
+            elif hasattr(s, 'action_features'):
+                successors.append((h, s))
+            else:
+                successors.append((None, s))
+    parts = [s.action_features() if h is not None else s.features()
+            for h, s in successors if s is not None]
+    scores = iter(model.score_batch(parts) if parts else ())
+    parts = iter(parts)
+    result = []
+    for h, s in successors:
+        if s is None:
+            result.append(h)
+        elif h is None:
+            result.append(Hypothesis(s, next(scores), lstack.stack((next(parts),))))
+        else:
+            result.append(Hypothesis(s, h.score + next(scores),
+                    h.feature_parts.push(next(parts))))
+    return result
+
+
+class BeamSearch:
+    """Beam search settings, see above. Unset settings are taken from config.
+    """
+
+    def __init__(self, width=None, width_per_word=None, margin=None, max_steps=None):
+        self.width = config.BEAM_WIDTH if width is None else width
+        self.width_per_word = config.BEAM_WIDTH_PER_WORD if width_per_word is None else width_per_word
+        self.margin = config.BEAM_MARGIN if margin is None else margin
+        self.max_steps = config.BEAM_MAX_STEPS if max_steps is None else max_steps
+
+    def beam_width(self, words):
+        return max(1, self.width + round(self.width_per_word * len(words)))
+
+    def select(self, agenda, width):
+        """Returns the best hypotheses in agenda, highest score first.
+
+        Hypotheses with equal scores keep their order.
+        """
+        beam = heapq.nlargest(width, agenda, key=lambda h: h.score)
+        if self.margin is not None and beam:
+            threshold = beam[0].score - self.margin
+            beam = [h for h in beam if h.score >= threshold]
+        return beam
+
+    def beams(self, words, lex, model):
+        """Generates the successive beams for parsing words.
+
+        Generates pairs of all scored successors of the previous beam (in
+        the order they were found) and the beam selected from them. The
+        first pair contains only the initial hypothesis. The search ends
+        when all hypotheses in the beam are finished, the beam is empty or
+        the step limit is reached.
+        """
+        width = self.beam_width(words)
+        beam = [initial_hypothesis(words)]
+        yield beam, beam
+        steps = 0
+        while any(not h.item.finished for h in beam):
+            if self.max_steps is not None and steps >= self.max_steps:
+                return
+            expanded = expand(beam, lex, model)
+            beam = self.select(expanded, width)
+            steps += 1
+            yield expanded, beam
+
+
+def parse(words, lex, model, search=None):
+    if search is None:
+        search = BeamSearch()
+    for _, beam in search.beams(words, lex, model):
+        pass
+    for h in beam:
+        if h.item.finished:
+            return h.item.stack[0].mr
+    raise ValueError('no parse found')
+
+
+def train(train_data, val_data, lex, max_epochs, patience, search=None):
     train_data = list(train_data)
-    model = models.Perceptron()
+    model = models.new_model()
     best_accuracy = 0
     best_model = model
     no_improvement_since = 0
     for t in range(max_epochs):
         random.shuffle(train_data)
-        train_one_epoch(train_data, lex, model)
+        train_one_epoch(train_data, lex, model, search)
         # Validate and see if the model got better:
         val_model = model.copy()
         val_model.average_weights()
-        val_accuracy = validate(t, val_data, lex, val_model)
+        val_accuracy = validate(t, val_data, lex, val_model, search)
         if val_accuracy > best_accuracy:
             best_accuracy = val_accuracy
             best_model = val_model
@@ -41,40 +180,49 @@ def train(train_data, val_data, lex, max_epochs, patience):
     return best_model
 
 
-def train_one_epoch(train_data, lex, model):
+def train_one_epoch(train_data, lex, model, search=None):
+    if search is None:
+        search = BeamSearch()
     for words, gold_action_sequence in train_data:
-        def is_correct(item):
+        def is_correct(hypothesis):
             return all(g == i for g, i in
-                       zip(gold_action_sequence, item.action_sequence()))
-        agenda = [parseitems.initial(words)]
-        while any(not i.finished for i in agenda):
-            agenda = [s for i in agenda for s in i.successors(lex)]
-            agenda.sort(key=lambda i: model.score(i.features()), reverse=True)
-            beam = agenda[:min(10, len(agenda))]
-            if not any(is_correct(i) for i in beam):
-                break # early update
+                       zip(gold_action_sequence, hypothesis.item.action_sequence()))
+        for expanded, beam in search.beams(words, lex, model):
             agenda = beam
-        highest_scoring_item = agenda[0]
-        highest_scoring_correct_item = next(i for i in agenda if is_correct(i))
-        if highest_scoring_item != highest_scoring_correct_item:
-            model.update(highest_scoring_correct_item.features(),
-                         highest_scoring_item.features())
+            if not any(is_correct(h) for h in beam):
+                # Early update, against all successors of this step:
+                agenda = expanded
+                break
+        # max returns the first of equally scored hypotheses, like the
+        # stable selection of the beam:
+        highest_scoring = max(agenda, key=lambda h: h.score)
+        highest_scoring_correct = max((h for h in agenda if is_correct(h)),
+                key=lambda h: h.score)
+        if highest_scoring.item != highest_scoring_correct.item:
+            model.update(highest_scoring_correct.features(),
+                         highest_scoring.features())
 
 
-def validate(epoch, val_data, lex, model):
+def validate(epoch, val_data, lex, model, search=None):
     total = 0
     parsed = 0
-    correct = 0
+    pred_mrs = []
+    gold_mrs = []
     for words, gold_mr in val_data:
         total += 1
         try:
-            pred_mr = parse(words, lex, model)
+            pred_mr = parse(words, lex, model, search)
         except ValueError:
             print('no parse for', words, file=sys.stderr)
             continue
         parsed += 1
-        if pred_mr.equivalent(gold_mr):
-            correct += 1
+        pred_mrs.append(pred_mr)
+        gold_mrs.append(gold_mr)
+    # Compare all predictions to gold at once:
+    symbols = termarrays.SymbolTable()
+    correct = int(termarrays.equivalent(
+            symbols.encode_batch(pred_mrs),
+            symbols.encode_batch(gold_mrs)).sum())
     coverage = parsed / total
     recall = correct / total
     precision = correct / parsed
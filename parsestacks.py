@@ -20,9 +20,14 @@ def fix_address(address, liftee_address):
 
 class StackElement:
 
+    # rejector_state is used by oracle.Rejector to store what it computed
+    # about this element, for reuse in successor items.
+    __slots__ = ('mr', 'secstack', 'rejector_state')
+
     def __init__(self, mr, secstack):
         self.mr = mr
         self.secstack = secstack
+        self.rejector_state = None
 
     def _target_address(self, secstack_position):
         # Retrieve the address at the given position on the secstack.
@@ -53,6 +58,7 @@ class StackElement:
             raise IllegalAction('can only drop into variable arguments')
         new = other.mr
         conj_num = 1
+        # old is a variable, so only the paths to its occurrences are copied:
         mr = self.mr.replace(old, new)
         secstack = self.secstack
         address_droppee = address_target + (arg_num, conj_num)
@@ -77,12 +83,18 @@ class StackElement:
             old = parent.args[arg_num - 1]
         # Determine the new (conjunctive term) to replace it with:
         if isinstance(old, terms.ConjunctiveTerm):
-            new = terms.ConjunctiveTerm(old.conjuncts + (other.mr,))
+            new = terms.make_conjunctive_term(old.conjuncts + (other.mr,))
             conj_num = len(new.conjuncts)
         else:
-            new = terms.ConjunctiveTerm((old, other.mr))
+            new = terms.make_conjunctive_term((old, other.mr))
             conj_num = 2
-        mr = self.mr.replace(old, new)
+        # Replace old by address, copying only the path to it:
+        if len(sibling_address) < 2:
+            mr = new
+        else:
+            args = parent.args[:arg_num - 1] + (new,) + parent.args[arg_num:]
+            new_parent = terms.make_complex_term(parent.functor_name, args)
+            mr = self.mr.replace_at(parent_address, new_parent)
         # Put the new conjunct onto the secondary stack:
         if len(sibling_address) < 2:
             droppee_address = (conj_num,)
@@ -106,6 +118,7 @@ class StackElement:
             raise IllegalAction('can only lift into variable arguments')
         new = other.mr
         conj_num = 1
+        # old is a variable, so only the paths to its occurrences are copied:
         mr = self.mr.replace(old, new)
         secstack = self.secstack
         address_liftee = address_target + (arg_num, conj_num)
@@ -142,6 +155,9 @@ class StackElement:
 
     def pop(self):
         try:
-            return StackElement(self.mr, self.secstack.pop())
+            element = StackElement(self.mr, self.secstack.pop())
         except IndexError:
             raise IllegalAction('cannot pop, secondary stack empty')
+        # The MR is unchanged, so is what the rejector knows about it:
+        element.rejector_state = self.rejector_state
+        return element
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+
+"""Reports the cost of oracle search for the training examples.
+
+Run
+
+    python3 -m searchreport [OPTIONS]
+
+to run the (breadth-first) oracle search with instrumentation (see
+oracle.Trace) on each example in geo880-train, one at a time. Examples are
+ranked by wall time, with their status, number of steps, largest beam and the
+numbers of successors pruned by each check. An example that fails, times out
+or runs out of memory is recorded as such rather than ending the report. With
+--memory, each example is searched a second time to measure its peak memory,
+since tracing memory distorts the times. With --steps N, the step-by-step
+trace of the N most costly examples is shown as well. See --help for further
+options.
+"""
+
+
+import argparse
+import collections
+import data
+import oracle
+import oracles
+import signal
+import time
+
+
+def run(words, mr, timeout=None, memory=False):
+    """Runs the oracle search for one example.
+
+    Returns the status ('ok', 'failed', 'timeout', 'memory' or 'error'), the
+    seconds taken and the trace. If memory is true, the trace has the peak
+    memory, but the times are distorted.
+    """
+    trace = oracle.Trace(memory)
+    stats = collections.Counter()
+    start = time.perf_counter()
+    try:
+        try:
+            if timeout is not None:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            oracle.action_sequence(words, mr, 'bfs', stats, trace=trace)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        status = 'ok'
+    except oracles.Timeout:
+        status = 'timeout'
+    except MemoryError:
+        status = 'memory'
+    except ValueError:
+        status = 'failed'
+    except Exception:
+        status = 'error'
+    return status, time.perf_counter() - start, trace
+
+
+def print_ranking(results):
+    print('{:>4} {:>5} {:>5} {:>8} {:>6} {:>10} {:>14} {:>8} {:>10} {:>10} {:>10}'.format(
+            'rank', 'index', 'words', 'status', 'steps', 'seconds', 'peak bytes',
+            'max beam', 'rejector', 'siblings', 'seen'))
+    for rank, (index, words, status, seconds, trace, peak_memory) in enumerate(results, start=1):
+        totals = trace.totals()
+        max_beam = max((step['beam'] for step in trace.steps), default=0)
+        peak = '-' if peak_memory is None else '{:,}'.format(peak_memory)
+        print('{:>4} {:>5} {:>5} {:>8} {:>6} {:>10.3f} {:>14} {:>8,} {:>10,} {:>10,} {:>10,}'.format(
+                rank, index, len(words), status, len(trace.steps), seconds,
+                peak, max_beam, totals['rejector'],
+                totals['siblings'], totals['seen']))
+
+
+def print_steps(index, words, trace):
+    print()
+    print('example {}: {}'.format(index, ' '.join(words)))
+    print('{:>5} {:>8} {:>10} {:>10} {:>10} {:>10} {:>8} {:>8} {:>8} {:>8}'.format(
+            'step', 'beam', 'succ.', 'rejector', 'siblings', 'seen',
+            'succ. s', 'rej. s', 'sib. s', 'seen s'))
+    for i, step in enumerate(trace.steps, start=1):
+        print('{:>5} {:>8,} {:>10,} {:>10,} {:>10,} {:>10,} {:>8.3f} {:>8.3f} {:>8.3f} {:>8.3f}'.format(
+                i, step['beam'], step['successors'], step['rejector'],
+                step['siblings'], step['seen'], step['successors_time'],
+                step['rejector_time'], step['siblings_time'], step['seen_time']))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Rank training examples by oracle search cost.')
+    arg_parser.add_argument('--examples', type=int, default=None,
+            help='only use the first EXAMPLES training examples')
+    arg_parser.add_argument('--timeout', type=float, default=60,
+            help='maximum number of seconds per example (default: 60)')
+    arg_parser.add_argument('--top', type=int, default=20,
+            help='number of examples to list (default: 20)')
+    arg_parser.add_argument('--steps', type=int, default=0,
+            help='show the steps of this many of the most costly examples')
+    arg_parser.add_argument('--memory', action='store_true',
+            help='also measure peak memory, in a separate search per example')
+    args = arg_parser.parse_args()
+    signal.signal(signal.SIGALRM, oracles.raise_timeout)
+    results = []
+    for index, (words, mr) in enumerate(data.geo880_train()[:args.examples]):
+        status, seconds, trace = run(words, mr, args.timeout)
+        peak_memory = None
+        if args.memory:
+            peak_memory = run(words, mr, args.timeout, memory=True)[2].peak_memory
+        results.append((index, words, status, seconds, trace, peak_memory))
+    results.sort(key=lambda r: r[3], reverse=True)
+    print_ranking(results[:args.top])
+    for index, words, status, seconds, trace, _ in results[:args.steps]:
+        print_steps(index, words, trace)
@@ -0,0 +1,162 @@
+"""Sets of seen items for duplicate detection in oracle search.
+
+The oracle search discards items equivalent to one it has seen before. Items
+are identified by a key (see oracle.item_codes), of which a seen set only
+stores a fixed-size digest. There are two kinds of sets for digests:
+
+* ExactSet is a Python set. It never mistakes a new item for a seen one, but
+  grows by about 90 bytes per item.
+* BloomFilter uses a fixed number of bits, chosen from the expected number of
+  items and an acceptable false positive rate. A false positive discards a new
+  item, so the search may miss an action sequence (or find a longer one), but
+  memory does not grow.
+
+A SeenSet also has a scope, which determines when digests can be forgotten:
+
+* 'search' remembers all items of the whole search.
+* 'offset' keeps one set per queue offset and forgets the sets of offsets
+  that no item in the beam has anymore, since the offset never decreases.
+  A Bloom filter cannot forget some of its digests, and its memory does not
+  grow anyway, so with Bloom filters, all offsets share one filter, of the
+  same size as with 'search' scope, with the offset added to the keys.
+* 'step' only remembers the items of the current step, i.e., detects
+  duplicates among the successors of one beam.
+
+Use exact sets with 'search' scope (the default, see config) unless memory is
+a problem. 'offset' then usually saves most memory without missing
+duplicates that matter. Bloom filters are for when even that is too much.
+
+Once a Bloom filter holds capacity digests, each new item is mistaken for a
+seen one with probability error_rate, and the probability grows beyond that
+as more items are added. In breadth-first search, a discarded item usually
+has equivalent alternatives. Best-first (A*) search expands far fewer items,
+so a false positive is more likely to discard the only item on a shortest
+path to the target, and then the search finds a longer action sequence or
+none at all. The oracle search takes capacity and error_rate from
+config.SEEN_BLOOM_CAPACITY and config.SEEN_BLOOM_ERROR_RATE. For A*, choose a
+capacity well above the number of items the search generates and an
+error_rate of 1e-6 or lower. Each halving of the error rate costs about 1.44
+bits per expected item.
+"""
+
+
+import hashlib
+import math
+import sys
+
+
+DIGEST_SIZE = 16
+
+
+def digest(key):
+    """Returns a fixed-size digest of a bytes key.
+    """
+    return hashlib.blake2b(key, digest_size=DIGEST_SIZE).digest()
+
+
+class ExactSet:
+
+    def __init__(self):
+        self.digests = set()
+
+    def add(self, digest):
+        """Adds digest, returns False if it was already there.
+        """
+        if digest in self.digests:
+            return False
+        self.digests.add(digest)
+        return True
+
+    def memory(self):
+        # Digests are bytes objects of the same size:
+        entry_size = sys.getsizeof(bytes(DIGEST_SIZE))
+        return sys.getsizeof(self.digests) + len(self.digests) * entry_size
+
+
+class BloomFilter:
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        self.num_bits = num_bits
+        self.bits = bytearray((num_bits + 7) // 8)
+
+    def add(self, digest):
+        """Adds digest, returns False if it was (probably) already there.
+        """
+        # Double hashing with two 64-bit halves of the digest:
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        new = False
+        for i in range(self.num_hashes):
+            bit = (h1 + i * h2) % self.num_bits
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                new = True
+        return new
+
+    def memory(self):
+        return sys.getsizeof(self.bits)
+
+
+class SeenSet:
+    """Duplicate detection for one search.
+
+    kind is 'exact' or 'bloom', scope is 'search', 'offset' or 'step' (see
+    above). options are passed to the BloomFilter constructor. peak_memory
+    is the largest number of bytes taken by the sets so far.
+    """
+
+    def __init__(self, kind='exact', scope='search', **options):
+        if kind not in ('exact', 'bloom'):
+            raise ValueError('unknown kind of seen set: ' + kind)
+        if scope not in ('search', 'offset', 'step'):
+            raise ValueError('unknown seen set scope: ' + scope)
+        self.kind = kind
+        self.scope = scope
+        self.options = options
+        self.sets = {}
+        self.peak_memory = 0
+
+    def _new_set(self):
+        if self.kind == 'exact':
+            return ExactSet()
+        return BloomFilter(**self.options)
+
+    def add(self, key, offset):
+        """Adds the key of an item with the given queue offset.
+
+        Returns False if an equivalent item was seen before.
+        """
+        scope_key = None
+        if self.scope == 'offset':
+            if self.kind == 'exact':
+                scope_key = offset
+            else:
+                key = b'%d:' % offset + key
+        if scope_key not in self.sets:
+            self.sets[scope_key] = self._new_set()
+        return self.sets[scope_key].add(digest(key))
+
+    def memory(self):
+        return sum(s.memory() for s in self.sets.values())
+
+    def step(self, items):
+        """Called before expanding the items of a beam.
+
+        Forgets what the scope allows to forget.
+        """
+        self.peak_memory = max(self.peak_memory, self.memory())
+        if self.scope == 'step':
+            self.sets.clear()
+        elif self.scope == 'offset' and self.kind == 'exact' and items:
+            min_offset = min(item.offset for item in items)
+            for offset in [o for o in self.sets if o < min_offset]:
+                del self.sets[offset]
+
+    def finish(self):
+        """Updates and returns peak_memory at the end of the search.
+        """
+        self.peak_memory = max(self.peak_memory, self.memory())
+        return self.peak_memory
@@ -0,0 +1,124 @@
+"""Flat array encoding of terms for batch comparison with NumPy.
+
+A term is encoded as a one-dimensional integer array in prefix order, derived
+from its canonical key (see terms). Non-negative codes are IDs of symbols
+(functors with their arity, conjunctions with their length, atoms and
+numbers), interned in a SymbolTable. Negative codes are variables, numbered
+-1, -2, ... in order of first occurrence. Two terms are therefore equivalent if
+and only if their encodings (with the same symbol table) are equal.
+
+Batches of terms are stored CSR-style as a Batch: one array with the codes of
+all terms concatenated and an array of offsets. Equivalence checks and duplicate
+detection then run over whole batches as array operations.
+"""
+
+
+import numpy as np
+import terms
+
+
+# Padding code for turning batches into matrices, never a valid code.
+_PAD = np.iinfo(np.int64).min
+
+
+class SymbolTable:
+
+    def __init__(self):
+        self.ids = {}
+        self.symbols = []
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def symbol_id(self, symbol):
+        if symbol not in self.ids:
+            self.ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return self.ids[symbol]
+
+    def encode_tokens(self, tokens):
+        """Encodes a sequence of canonical key tokens as a list of codes.
+        """
+        return [-token - 1 if isinstance(token, int) else self.symbol_id(token)
+                for token in tokens]
+
+    def encode(self, term):
+        return np.array(self.encode_tokens(term.canonical_key()), dtype=np.int64)
+
+    def encode_batch(self, term_list):
+        return make_batch(self.encode_tokens(term.canonical_key()) for term in term_list)
+
+    def decode(self, codes):
+        """Converts an encoded term back into a term object.
+        """
+        return terms.from_tokens(decode_tokens(codes, self.symbols))
+
+
+def decode_tokens(codes, symbols):
+    """Converts codes back into canonical key tokens, see encode_tokens.
+    """
+    return [symbols[code] if code >= 0 else -code - 1 for code in map(int, codes)]
+
+
+class Batch:
+    """A sequence of encoded terms (or other code sequences).
+    """
+
+    def __init__(self, codes, offsets):
+        self.codes = codes
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.codes[self.offsets[index]:self.offsets[index + 1]]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def matrix(self, width=None, fill=_PAD):
+        """Returns the codes as a matrix with one row per term, padded.
+
+        The padding code is fill, by default one that is never a valid code.
+        """
+        lengths = self.lengths()
+        if width is None:
+            width = int(lengths.max(initial=0))
+        result = np.full((len(self), width), fill, dtype=np.int64)
+        rows = np.repeat(np.arange(len(self)), lengths)
+        cols = np.arange(len(self.codes)) - np.repeat(self.offsets[:-1], lengths)
+        result[rows, cols] = self.codes
+        return result
+
+
+def make_batch(rows):
+    """Makes a Batch from an iterable of code sequences.
+    """
+    codes = []
+    offsets = [0]
+    for row in rows:
+        codes.extend(row)
+        offsets.append(len(codes))
+    return Batch(np.array(codes, dtype=np.int64), np.array(offsets, dtype=np.int64))
+
+
+def equivalent(batch1, batch2):
+    """Compares two batches of the same size term by term.
+
+    Returns a boolean array whose i-th element says whether the i-th terms
+    are equivalent. Both batches must be encoded with the same symbol table.
+    """
+    width = int(max(batch1.lengths().max(initial=0), batch2.lengths().max(initial=0)))
+    return (batch1.matrix(width) == batch2.matrix(width)).all(axis=1)
+
+
+def first_occurrences(batch):
+    """Returns a boolean array that is True for the first of equal rows.
+    """
+    if len(batch) == 0:
+        return np.zeros(0, dtype=bool)
+    _, indices = np.unique(batch.matrix(), axis=0, return_index=True)
+    result = np.zeros(len(batch), dtype=bool)
+    result[indices] = True
+    return result
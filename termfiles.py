@@ -0,0 +1,161 @@
+"""Compact binary files of terms.
+
+A term file stores a sequence of terms as records that can be decoded lazily
+and in any order from a memory-mapped file, without parsing text. Each term is
+stored as its canonical key (see terms), with the symbols (functors, atoms,
+numbers) interned in a symbol table shared by all records.
+
+File Format
+===========
+
+All integers are little-endian.
+
+    header   magic (8 bytes), version (u32), number of records (u32),
+             offset of the symbol table (u64), offset of the index (u64)
+    records  one per term: number of codes (u32), codes (i32 each)
+    symbols  number of symbols (u32), then per symbol its two components,
+             each a type tag (u8) and either an i64 (tag 0) or a u32 length
+             and UTF-8 bytes (tag 1)
+    index    offset of each record (u64 each)
+
+A non-negative code is the index of a symbol in the symbol table, a negative
+code -n-1 is the variable numbered n.
+"""
+
+
+import array
+import mmap
+import struct
+import sys
+import terms
+
+
+MAGIC = b'GEOPAR\x00\x00'
+VERSION = 1
+_HEADER = struct.Struct('<8sIIQQ')
+_U32 = struct.Struct('<I')
+_I64 = struct.Struct('<q')
+
+
+def is_term_file(path):
+    """Checks whether the file at path is a term file (rather than text).
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_term_file(path, term_seq):
+    """Writes the terms in term_seq to a new term file at path.
+    """
+    symbol_ids = {}
+    symbols = []
+    offsets = []
+    with open(path, 'wb') as f:
+        f.write(bytes(_HEADER.size))
+        for term in term_seq:
+            codes = array.array('i')
+            for token in term.canonical_key():
+                if isinstance(token, int):
+                    codes.append(-token - 1)
+                else:
+                    if token not in symbol_ids:
+                        symbol_ids[token] = len(symbols)
+                        symbols.append(token)
+                    codes.append(symbol_ids[token])
+            if sys.byteorder == 'big':
+                codes.byteswap()
+            offsets.append(f.tell())
+            f.write(_U32.pack(len(codes)))
+            f.write(codes.tobytes())
+        symbols_offset = f.tell()
+        f.write(_U32.pack(len(symbols)))
+        for symbol in symbols:
+            for component in symbol:
+                _write_component(f, component)
+        index_offset = f.tell()
+        index = array.array('Q', offsets)
+        if sys.byteorder == 'big':
+            index.byteswap()
+        f.write(index.tobytes())
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, len(offsets), symbols_offset, index_offset))
+
+
+def _write_component(f, component):
+    if isinstance(component, int):
+        f.write(b'\x00')
+        f.write(_I64.pack(component))
+    else:
+        data = component.encode('utf-8')
+        f.write(b'\x01')
+        f.write(_U32.pack(len(data)))
+        f.write(data)
+
+
+class TermFile:
+    """Read access to a term file.
+
+    Behaves like a read-only sequence of terms. Only the symbol table is read
+    when opening the file, records are decoded when accessed.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, symbols_offset, index_offset = _HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('not a term file: ' + path)
+        if version != VERSION:
+            raise ValueError('unsupported term file version {}: {}'.format(version, path))
+        self.count = count
+        self.symbols = _read_symbols(self.buffer, symbols_offset)
+        self.index_offset = index_offset
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return terms.from_tokens(self.tokens(index))
+
+    def tokens(self, index):
+        """Returns the canonical key of the term at index, without building it.
+        """
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        offset, = struct.unpack_from('<Q', self.buffer, self.index_offset + 8 * index)
+        length, = _U32.unpack_from(self.buffer, offset)
+        start = offset + _U32.size
+        codes = array.array('i')
+        codes.frombytes(self.buffer[start:start + 4 * length])
+        if sys.byteorder == 'big':
+            codes.byteswap()
+        return [self.symbols[code] if code >= 0 else -code - 1 for code in codes]
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def close(self):
+        self.buffer.close()
+
+
+def _read_symbols(buffer, offset):
+    count, = _U32.unpack_from(buffer, offset)
+    offset += _U32.size
+    symbols = []
+    for _ in range(count):
+        symbol = []
+        for _ in range(2):
+            tag = buffer[offset]
+            offset += 1
+            if tag == 0:
+                component, = _I64.unpack_from(buffer, offset)
+                offset += _I64.size
+            else:
+                length, = _U32.unpack_from(buffer, offset)
+                offset += _U32.size
+                component = buffer[offset:offset + length].decode('utf-8')
+                offset += length
+            symbol.append(component)
+        symbols.append(tuple(symbol))
+    return symbols
@@ -29,11 +29,59 @@ term.replace(old, new) where old and new are terms returns a new version of
 term where all token-identical occurrences of old have been replaced with new.
 Note that equivalence implies token-identity only for variables.
 
+term.replace_at(address, new) returns a new version of term where the subterm
+at address has been replaced with new. Only the terms on the path from term to
+the address are copied, all other subterms are shared with term. Replacing a
+variable uses the memoized term.variable_addresses() to do the same for each
+occurrence of the variable.
+
 Fragments
 =========
 
 A "fragment" F of a term T is a "partially constructed" version of T, which may
 yet be turned into T by adding additional conjuncts to arguments in F.
+term.fragments() lazily generates the fragments of term without duplicates
+(equivalent fragments). The fragments of subterms are computed once per
+subterm object and reused. term.count_fragment_candidates() counts the
+fragments including duplicates without generating them, so it can exceed the
+number of fragments that term.fragments() yields. FragmentIndex finds the
+fragment of a term equivalent to a given term without enumerating all
+fragments.
+
+Interning
+=========
+
+Terms should be built with the factory functions make_atom, make_number,
+make_complex_term and make_conjunctive_term rather than with the class
+constructors. The factory interns ground terms (terms without variables): a
+structurally identical ground term is only created once, so e.g. all
+occurrences of stateid(texas) are the same object, and equality of ground terms
+is an identity check. The table of interned terms only holds weak references,
+so a term is dropped from it as soon as nothing else refers to it. Interning
+can be switched off with set_interning(False), e.g. to benchmark the two
+representations against each other.
+
+Since interned terms are shared by everything that built an equal term, their
+attributes (functor_name, args, conjuncts, name, number) must never be
+assigned to; build a new term with the factory instead. Operations based on
+token identity see all occurrences of an interned ground term as the same
+token: replace(old, new) with a ground old replaces all of them, and marking
+a ground term in to_string marks all of them. Variables are never interned,
+so subsumes bindings and variable replacement are not affected.
+
+Every term also carries a precomputed structural_hash which is invariant under
+variable renaming, so terms with different structural hashes are never
+equivalent.
+
+Canonical Keys
+==============
+
+term.canonical_key() returns a hashable tuple that is the same for two terms
+if and only if they are equivalent, i.e., identical up to variable renaming.
+It is computed once per term and then memoized, so it is a cheap replacement
+for comparing or counting terms by their to_string(). joint_canonical_key does
+the same for a sequence of terms that may share variables. from_tokens converts
+a canonical key back into a term.
 """
 
 
@@ -42,21 +90,26 @@ import itertools
 import lstack
 import re
 import util
+import weakref
 
 
-_VARIABLE_PATTERN = re.compile('[A-Z]')
-_ANONYMOUS_VARIABLE_PATTERN = re.compile('_')
-_COMPLEX_TERM_START_PATTERN = re.compile('(?P<functor_name>[a-z][a-z_0-9]*)\(')
-_COMMA_PATTERN = re.compile(', ?')
-_COMPLEX_TERM_END_PATTERN = re.compile('\)')
 _ATOM_PATTERN = re.compile('[a-z?]+')
-_QUOTED_ATOM_PATTERN = re.compile('\'[a-z?. ]+\'')
-_NUMBER_PATTERN = re.compile('[0-9]+')
-_LIST_START_PATTERN = re.compile('\[')
-_LIST_END_PATTERN = re.compile(']')
-_CONJUNCTIVE_TERM_START_PATTERN = re.compile('\(')
-_CONJUNCTIVE_TERM_END_PATTERN = re.compile('\)')
-_NEGATION_START_PATTERN = re.compile(r'(?P<functor_name>\\\+(_\d+)?) ?')
+# Alternatives are tried in order, e.g., complex terms before atoms:
+_TERM_START_PATTERN = re.compile(r"""
+    (?P<variable>[A-Z][A-Za-z_0-9]*)
+  | (?P<anonymous_variable>_)
+  | (?P<complex_term>(?P<functor_name>[a-z][a-z_0-9]*)\()
+  | (?P<atom>[a-z?]+)
+  | (?P<quoted_atom>'[a-z?. ]+')
+  | (?P<number>[0-9]+)
+  | (?P<list>\[)
+  | (?P<conjunctive_term>\()
+  | (?P<negation>(?P<negation_name>\\\+(_\d+)?)\ ?)
+""", re.VERBOSE)
+_TERM_END_PATTERN = re.compile(r'(?P<comma>, ?)|(?P<paren>\))|(?P<bracket>])')
+_TERM_SEPARATOR_PATTERN = re.compile(r'\.?\s*')
+# Closing token expected by each kind of open term:
+_CLOSERS = {'complex_term': 'paren', 'conjunctive_term': 'paren', 'list': 'bracket'}
 
 
 def _unquote(quoted_atom):
@@ -70,49 +123,109 @@ def _unquote(quoted_atom):
 
 class Term:
 
+    # Terms are allocated in large numbers, so they use __slots__ rather than
+    # per-instance dicts. Subclasses initialize the memo slots. __weakref__
+    # lets the intern table hold terms weakly.
+    __slots__ = ('_canonical_key', '_variable_addresses', '__weakref__')
+
     def equivalent(self, other):
-        return self.subsumes(other) and other.subsumes(self)
+        if self is other:
+            return True
+        if self.structural_hash != other.structural_hash:
+            return False
+        if self._canonical_key is not None and other._canonical_key is not None:
+            return self._canonical_key == other._canonical_key
+        return variant(self, other)
+
+    def subsumes(self, other, bindings=None):
+        """Checks whether other is an instance of this term.
+
+        bindings maps variables of this term to subterms of other. If given, it
+        is extended, so it can be shared between several calls.
+        """
+        if bindings is None:
+            bindings = {}
+        return subsumes_all(((self, other),), bindings)
+
+    def canonical_key(self):
+        if self._canonical_key is None:
+            self._canonical_key = joint_canonical_key((self,))
+        return self._canonical_key
 
     def subterms(self):
         yield self
 
     def fragments(self):
+        """Generates the fragments of this term without duplicates.
+
+        Their number can be smaller than count_fragment_candidates(), which
+        also counts duplicates.
+        """
         yield self
 
+    def count_fragment_candidates(self):
+        """Returns an upper bound on the number of fragments, without generating them.
+
+        This is the number of fragments including duplicates, i.e., the length
+        of memoized_fragments(self).
+        """
+        return 1
+
     def at_address(self, address):
         if not len(address) == 0:
             raise IndexError()
         return self
 
+    def replace_at(self, address, new):
+        if not len(address) == 0:
+            raise IndexError()
+        return new
+
+    def variable_addresses(self):
+        """Returns a dict mapping variables to the addresses of their occurrences.
+        """
+        return {}
+
     def augment(self, predicate_counter=None):
         return self
 
 
 class Variable(Term):
 
+    __slots__ = ()
+    ground = False
+    structural_hash = hash('Variable')
+
+    def __init__(self):
+        self._canonical_key = None
+        self._variable_addresses = None
+
     def to_string(self, var_name_dict=None, marked_terms=None):
         if var_name_dict is None:
             var_name_dict = make_var_name_dict()
         return var_name_dict[self]
 
-    def subsumes(self, other, bindings=None):
-        if bindings is None:
-            bindings = {}
-        if self in bindings:
-            return other == bindings[self]
-        bindings[self] = other
-        return True
-
     def replace(self, old, new):
         if self == old:
             return new
         return self
 
+    def variable_addresses(self):
+        if self._variable_addresses is None:
+            self._variable_addresses = {self: ((),)}
+        return self._variable_addresses
+
 
 class Atom(Term):
 
+    __slots__ = ('name', 'structural_hash')
+    ground = True
+
     def __init__(self, name):
         self.name = name
+        self.structural_hash = hash((Atom, name))
+        self._canonical_key = None
+        self._variable_addresses = None
 
     def to_string(self, var_name_dict=None, marked_terms=None):
         match = _ATOM_PATTERN.fullmatch(self.name)
@@ -120,13 +233,6 @@ class Atom(Term):
             return self.name
         return "'" + self.name.replace("\\", "\\\\").replace("'", "\\'") + "'"
 
-    def subsumes(self, other, bindings=None):
-        if not isinstance(other, Atom):
-            return False
-        if not other.name == self.name:
-            return False
-        return True
-
     def __str__(self):
         return self.name
 
@@ -138,9 +244,21 @@ class Atom(Term):
 
 class ComplexTerm(Term):
 
+    __slots__ = ('functor_name', 'args', 'ground', 'structural_hash', '_subterms', '_fragments')
+
     def __init__(self, functor_name, args):
         self.functor_name = functor_name
         self.args = tuple(args)
+        self.ground = True
+        hashes = [functor_name]
+        for arg in self.args:
+            self.ground = self.ground and arg.ground
+            hashes.append(arg.structural_hash)
+        self.structural_hash = hash(tuple(hashes))
+        self._canonical_key = None
+        self._variable_addresses = None
+        self._subterms = None
+        self._fragments = None
 
     def to_string(self, var_name_dict=None, marked_terms=None):
         if var_name_dict is None:
@@ -163,33 +281,68 @@ class ComplexTerm(Term):
         return prefix + self.functor_name + '(' + sep.join(arg.to_string(var_name_dict, marked_terms) for arg in self.args) + ')'
 
     def subterms(self):
-        yield self
-        for arg in self.args:
-            yield from arg.subterms()
+        if self._subterms is None:
+            subterms = [self]
+            for arg in self.args:
+                subterms.extend(arg.subterms())
+            self._subterms = tuple(subterms)
+        return self._subterms
 
     def fragments(self):
+        return _unique_fragments(self._all_fragments())
+
+    def _all_fragments(self):
         for fragments in args_fragments(self.args):
-            yield ComplexTerm(self.functor_name, fragments)
+            yield make_complex_term(self.functor_name, fragments)
 
-    def subsumes(self, other, bindings=None):
-        if not isinstance(other, ComplexTerm):
-            return False
-        if other.functor_name != self.functor_name:
-            return False
-        if len(other.args) != len(self.args):
-            return False
-        if bindings is None:
-            bindings = {}
-        for a, b in zip(self.args, other.args):
-            if not a.subsumes(b, bindings):
-                return False
-        return True
+    def count_fragment_candidates(self):
+        count = 1
+        for arg in self.args:
+            count *= _has_placeholder(arg) + arg.count_fragment_candidates()
+        return count
 
     def replace(self, old, new):
         if self == old:
             return new
-        args = (arg.replace(old, new) for arg in self.args)
-        return ComplexTerm(self.functor_name, args)
+        if isinstance(old, Variable):
+            return _replace_variable(self, old, new)
+        args = tuple(arg.replace(old, new) for arg in self.args)
+        if all(a is b for a, b in zip(args, self.args)):
+            return self
+        return make_complex_term(self.functor_name, args)
+
+    def replace_at(self, address, new):
+        if len(address) == 0:
+            return new
+        arg_num = address[0]
+        conj_num = address[1]
+        arg = self.args[arg_num - 1]
+        if isinstance(arg, ConjunctiveTerm):
+            arg = arg.replace_at(address[1:], new)
+        else:
+            if conj_num != 1:
+                raise IndexError()
+            arg = arg.replace_at(address[2:], new)
+        args = self.args[:arg_num - 1] + (arg,) + self.args[arg_num:]
+        return make_complex_term(self.functor_name, args)
+
+    def variable_addresses(self):
+        if self._variable_addresses is None:
+            result = {}
+            if not self.ground:
+                for arg_num, arg in enumerate(self.args, start=1):
+                    if isinstance(arg, ConjunctiveTerm):
+                        children = enumerate(arg.conjuncts, start=1)
+                    elif isinstance(arg, Term):
+                        children = ((1, arg),)
+                    else: # List
+                        continue
+                    for conj_num, child in children:
+                        prefix = (arg_num, conj_num)
+                        for var, addresses in child.variable_addresses().items():
+                            result[var] = result.get(var, ()) + tuple(prefix + a for a in addresses)
+            self._variable_addresses = result
+        return self._variable_addresses
 
     def at_address(self, address):
         if len(address) == 0:
@@ -218,13 +371,21 @@ class ComplexTerm(Term):
             args = self.args
         else:
             args = tuple(a.augment(predicate_counter) for a in self.args)
-        return ComplexTerm(functor_name, args)
+        return make_complex_term(functor_name, args)
 
 
 class ConjunctiveTerm(Term):
 
+    __slots__ = ('conjuncts', 'ground', 'structural_hash', '_subterms', '_fragments')
+
     def __init__(self, conjuncts):
         self.conjuncts = tuple(conjuncts)
+        self.ground = all(conjunct.ground for conjunct in self.conjuncts)
+        self.structural_hash = hash((ConjunctiveTerm,) + tuple(conjunct.structural_hash for conjunct in self.conjuncts))
+        self._canonical_key = None
+        self._variable_addresses = None
+        self._subterms = None
+        self._fragments = None
 
     def to_string(self, var_name_dict=None, marked_terms=None):
         if var_name_dict is None:
@@ -234,60 +395,87 @@ class ConjunctiveTerm(Term):
         return '(' + ','.join(conjunct.to_string(var_name_dict, marked_terms) for conjunct in self.conjuncts) + ')'
 
     def subterms(self):
-        yield self
-        for conjunct in self.conjuncts:
-            yield from conjunct.subterms()
+        if self._subterms is None:
+            subterms = [self]
+            for conjunct in self.conjuncts:
+                subterms.extend(conjunct.subterms())
+            self._subterms = tuple(subterms)
+        return self._subterms
 
     def fragments(self):
+        return _unique_fragments(self._all_fragments())
+
+    def _all_fragments(self):
         for start in range(0, len(self.conjuncts)):
             for end in range(start + 1, len(self.conjuncts) + 1):
                 for fragments in conjuncts_fragments(self.conjuncts[start:end]):
                     if len(fragments) == 1:
                         yield fragments[0]
                     else:
-                        yield ConjunctiveTerm(fragments)
-
-    def subsumes(self, other, bindings=None):
-        if not isinstance(other, ConjunctiveTerm):
-            return False
-        if len(other.conjuncts) != len(self.conjuncts):
-            return False
-        if bindings is None:
-            bindings = {}
-        for a, b in zip(self.conjuncts, other.conjuncts):
-            if not a.subsumes(b, bindings):
-                return False
-        return True
+                        yield make_conjunctive_term(fragments)
+
+    def count_fragment_candidates(self):
+        counts = [conjunct.count_fragment_candidates() for conjunct in self.conjuncts]
+        total = 0
+        for start in range(len(counts)):
+            product = 1
+            for count in counts[start:]:
+                product *= count
+                total += product
+        return total
 
     def replace(self, old, new):
         if self == old:
             return new
-        return ConjunctiveTerm(c.replace(old, new) for c in self.conjuncts)
+        if isinstance(old, Variable):
+            return _replace_variable(self, old, new)
+        conjuncts = tuple(c.replace(old, new) for c in self.conjuncts)
+        if all(a is b for a, b in zip(conjuncts, self.conjuncts)):
+            return self
+        return make_conjunctive_term(conjuncts)
 
     def at_address(self, address):
         if not address:
             return self
         return self.conjuncts[address[0] - 1].at_address(address[1:])
 
+    def replace_at(self, address, new):
+        if not address:
+            return new
+        conj_num = address[0]
+        conjunct = self.conjuncts[conj_num - 1].replace_at(address[1:], new)
+        conjuncts = self.conjuncts[:conj_num - 1] + (conjunct,) + self.conjuncts[conj_num:]
+        return make_conjunctive_term(conjuncts)
+
+    def variable_addresses(self):
+        if self._variable_addresses is None:
+            result = {}
+            for conj_num, conjunct in enumerate(self.conjuncts, start=1):
+                for var, addresses in conjunct.variable_addresses().items():
+                    result[var] = result.get(var, ()) + tuple((conj_num,) + a for a in addresses)
+            self._variable_addresses = result
+        return self._variable_addresses
+
     def augment(self, predicate_counter=None):
         if predicate_counter is None:
             predicate_counter = collections.Counter()
-        return ConjunctiveTerm(c.augment(predicate_counter) for c in self.conjuncts)
+        return make_conjunctive_term(c.augment(predicate_counter) for c in self.conjuncts)
 
 
 class Number(Term):
 
+    __slots__ = ('number', 'structural_hash')
+    ground = True
+
     def __init__(self, number):
         self.number = number
+        self.structural_hash = hash((Number, number))
+        self._canonical_key = None
+        self._variable_addresses = None
 
     def to_string(self, var_name_dict=None, marked_terms=None):
         return str(self.number)
 
-    def subsumes(self, other, bindings=None):
-        if not isinstance(other, Number):
-            return False
-        return self.number == other.number
-
     def __str__(self):
         return str(self.number)
 
@@ -299,8 +487,13 @@ class Number(Term):
 
 class List:
 
+    # Lists only occur in NLU-MR pairs and are never interned.
+    ground = False
+    _canonical_key = None
+
     def __init__(self, elements):
         self.elements = elements
+        self.structural_hash = hash((List,) + tuple(element.structural_hash for element in elements))
 
     def to_string(self, var_name_dict=None, marked_terms=None):
         if var_name_dict is None:
@@ -311,98 +504,323 @@ class List:
 
 
 def read_term(string, name_var_dict=None):
+    """Reads a term from the beginning of string.
+
+    Returns the term and the rest of the string.
+    """
     if name_var_dict is None:
         name_var_dict = collections.defaultdict(Variable)
-    match = _VARIABLE_PATTERN.match(string)
-    if match:
-        variable_name = match.group()
-        rest = string[match.end():]
-        return name_var_dict[variable_name], rest
-    match = _ANONYMOUS_VARIABLE_PATTERN.match(string)
-    if match:
-        rest = string[match.end():]
-        return Variable(), rest
-    match = _COMPLEX_TERM_START_PATTERN.match(string)
-    if match:
-        functor_name = match.group('functor_name')
-        rest = string[match.end():]
-        args = []
-        arg1, rest = read_term(rest, name_var_dict)
-        args.append(arg1)
-        while True:
-            match = _COMPLEX_TERM_END_PATTERN.match(rest)
-            if match:
-                rest = rest[match.end():]
-                return ComplexTerm(functor_name, args), rest
-            match = _COMMA_PATTERN.match(rest)
-            if not match:
-                raise RuntimeError("couldn't parse term suffix: " + rest)
-            rest = rest[match.end():]
-            arg, rest = read_term(rest, name_var_dict)
-            args.append(arg)
-    match = _ATOM_PATTERN.match(string)
-    if match:
-        name = match.group()
-        rest = string[match.end():]
-        return Atom(name), rest
-    match = _QUOTED_ATOM_PATTERN.match(string)
-    if match:
-        name = _unquote(match.group())
-        rest = string[match.end():]
-        return Atom(name), rest
-    match = _NUMBER_PATTERN.match(string)
-    if match:
-        number = int(match.group())
-        rest = string[match.end():]
-        return Number(number), rest
-    match = _LIST_START_PATTERN.match(string)
-    if match:
-        rest = string[match.end():]
-        elements = []
-        element1, rest = read_term(rest, name_var_dict)
-        elements.append(element1)
-        while True:
-            match = _LIST_END_PATTERN.match(rest)
-            if match:
-                rest = rest[match.end():]
-                return List(elements), rest
-            match = _COMMA_PATTERN.match(rest)
-            if not match:
-                raise RuntimeError("couldn't parse term suffix: " + rest)
-            rest = rest[match.end():]
-            element, rest = read_term(rest, name_var_dict)
-            elements.append(element)
-    match = _CONJUNCTIVE_TERM_START_PATTERN.match(string)
-    if match:
-        rest = string[match.end():]
-        conjuncts = []
-        conjunct1, rest = read_term(rest, name_var_dict)
-        conjuncts.append(conjunct1)
+    term, pos = _read_term(string, 0, name_var_dict)
+    return term, string[pos:]
+
+
+def _read_term(string, pos, name_var_dict):
+    # Reads a term starting at position pos in string, returns it with the
+    # position after it. Works with an explicit stack of open terms instead of
+    # recursion, each entry consisting of the kind of term, its functor name
+    # (if any) and the list of its children read so far.
+    stack = []
+    while True:
+        match = _TERM_START_PATTERN.match(string, pos)
+        if not match:
+            raise RuntimeError("couldn't parse term suffix: " + string[pos:])
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == 'variable':
+            term = name_var_dict[match.group()]
+        elif kind == 'anonymous_variable':
+            term = Variable()
+        elif kind == 'atom':
+            term = make_atom(match.group())
+        elif kind == 'quoted_atom':
+            term = make_atom(_unquote(match.group()))
+        elif kind == 'number':
+            term = make_number(int(match.group()))
+        elif kind == 'complex_term':
+            stack.append((kind, match.group('functor_name'), []))
+            continue
+        elif kind == 'negation':
+            stack.append((kind, match.group('negation_name'), []))
+            continue
+        else:
+            stack.append((kind, None, []))
+            continue
+        # A term is complete, add it to the open terms, closing them as
+        # applicable:
         while True:
-            match = _CONJUNCTIVE_TERM_END_PATTERN.match(rest)
-            if match:
-                rest = rest[match.end():]
-                return ConjunctiveTerm(conjuncts), rest
-            match = _COMMA_PATTERN.match(rest)
-            if not match:
-                raise RuntimeError("couldn't parse term suffix: " + rest)
-            rest = rest[match.end():]
-            conjunct, rest = read_term(rest, name_var_dict)
-            conjuncts.append(conjunct)
-    match = _NEGATION_START_PATTERN.match(string)
-    if match:
-        functor_name = match.group('functor_name')
-        rest = string[match.end():]
-        scope, rest = read_term(rest, name_var_dict)
-        return ComplexTerm(functor_name, [scope]), rest
-    raise RuntimeError("couldn't parse term suffix: " + string)
+            if not stack:
+                return term, pos
+            kind, functor_name, children = stack[-1]
+            children.append(term)
+            if kind == 'negation':
+                stack.pop()
+                term = make_complex_term(functor_name, children)
+                continue
+            match = _TERM_END_PATTERN.match(string, pos)
+            if not match or match.lastgroup not in ('comma', _CLOSERS[kind]):
+                raise RuntimeError("couldn't parse term suffix: " + string[pos:])
+            pos = match.end()
+            if match.lastgroup == 'comma':
+                break
+            stack.pop()
+            if kind == 'complex_term':
+                term = make_complex_term(functor_name, children)
+            elif kind == 'conjunctive_term':
+                term = make_conjunctive_term(children)
+            else:
+                term = List(children)
+
+
+def read_terms(string):
+    """Reads all terms in string.
+
+    Terms may be followed by a period and are separated by whitespace, as in
+    the lines of the GeoQuery data files. Each term has its own variables.
+    Returns a list of terms.
+    """
+    result = []
+    pos = _TERM_SEPARATOR_PATTERN.match(string).end()
+    while pos < len(string):
+        term, pos = _read_term(string, pos, collections.defaultdict(Variable))
+        pos = _TERM_SEPARATOR_PATTERN.match(string, pos).end()
+        result.append(term)
+    return result
+
+
+def read_term_file(path):
+    """Reads all terms in the file at path, see read_terms.
+    """
+    with open(path) as f:
+        return read_terms(f.read())
+
+
+# Maps structural keys to interned ground terms, None if interning is off.
+_intern_table = weakref.WeakValueDictionary()
+
+
+def set_interning(enabled):
+    """Switches interning of ground terms on or off.
+
+    Also empties the table of interned terms.
+    """
+    global _intern_table
+    if enabled:
+        _intern_table = weakref.WeakValueDictionary()
+    else:
+        _intern_table = None
+
+
+def _intern(key, term):
+    interned = _intern_table.get(key)
+    if interned is None:
+        _intern_table[key] = interned = term
+    return interned
+
+
+def make_atom(name):
+    term = Atom(name)
+    if _intern_table is None:
+        return term
+    return _intern((Atom, name), term)
+
+
+def make_number(number):
+    term = Number(number)
+    if _intern_table is None:
+        return term
+    return _intern((Number, number), term)
+
+
+def make_complex_term(functor_name, args):
+    term = ComplexTerm(functor_name, args)
+    if _intern_table is None or not term.ground:
+        return term
+    # The args are interned, so the key is cheap to hash and compare.
+    return _intern((ComplexTerm, functor_name, term.args), term)
+
+
+def make_conjunctive_term(conjuncts):
+    term = ConjunctiveTerm(conjuncts)
+    if _intern_table is None or not term.ground:
+        return term
+    return _intern((ConjunctiveTerm, term.conjuncts), term)
 
 
 def from_string(string):
-    term, _ = read_term(string)
+    term, _ = _read_term(string, 0, collections.defaultdict(Variable))
+    return term
+
+
+def subsumes_all(pairs, bindings=None):
+    """Checks whether each general term in pairs subsumes the specific one.
+
+    pairs is an iterable of (general, specific) pairs of terms, which all
+    share one dict of variable bindings. Works without recursion and stops at
+    the first failure, without consuming the rest of pairs.
+    """
+    if bindings is None:
+        bindings = {}
+    agenda = []
+    for pair in pairs:
+        agenda.append(pair)
+        while agenda:
+            general, specific = agenda.pop()
+            if general is specific and general.ground:
+                continue
+            if isinstance(general, Variable):
+                if general in bindings:
+                    if bindings[general] is not specific:
+                        return False
+                else:
+                    bindings[general] = specific
+            elif isinstance(general, ComplexTerm):
+                if not isinstance(specific, ComplexTerm) \
+                        or specific.functor_name != general.functor_name \
+                        or len(specific.args) != len(general.args):
+                    return False
+                # Reversed, so that arguments are checked from left to right:
+                agenda.extend(zip(reversed(general.args), reversed(specific.args)))
+            elif isinstance(general, ConjunctiveTerm):
+                if not isinstance(specific, ConjunctiveTerm) \
+                        or len(specific.conjuncts) != len(general.conjuncts):
+                    return False
+                agenda.extend(zip(reversed(general.conjuncts), reversed(specific.conjuncts)))
+            elif isinstance(general, Atom):
+                if not isinstance(specific, Atom) or specific.name != general.name:
+                    return False
+            elif isinstance(general, Number):
+                if not isinstance(specific, Number) or specific.number != general.number:
+                    return False
+            else:
+                return False
+    return True
+
+
+def variant(term1, term2):
+    """Checks whether two terms are equal up to variable renaming.
+
+    Equivalent to term1.subsumes(term2) and term2.subsumes(term1), but does a
+    single pass, maintaining a bijection between the variables of both terms.
+    """
+    forward = {}
+    backward = {}
+    agenda = [(term1, term2)]
+    while agenda:
+        term1, term2 = agenda.pop()
+        if term1 is term2 and term1.ground:
+            continue
+        if term1.structural_hash != term2.structural_hash:
+            return False
+        if isinstance(term1, Variable):
+            if not isinstance(term2, Variable):
+                return False
+            if forward.setdefault(term1, term2) is not term2:
+                return False
+            if backward.setdefault(term2, term1) is not term1:
+                return False
+        elif isinstance(term1, ComplexTerm):
+            if not isinstance(term2, ComplexTerm) \
+                    or term2.functor_name != term1.functor_name \
+                    or len(term2.args) != len(term1.args):
+                return False
+            agenda.extend(zip(term1.args, term2.args))
+        elif isinstance(term1, ConjunctiveTerm):
+            if not isinstance(term2, ConjunctiveTerm) \
+                    or len(term2.conjuncts) != len(term1.conjuncts):
+                return False
+            agenda.extend(zip(term1.conjuncts, term2.conjuncts))
+        elif isinstance(term1, Atom):
+            if not isinstance(term2, Atom) or term2.name != term1.name:
+                return False
+        elif isinstance(term1, Number):
+            if not isinstance(term2, Number) or term2.number != term1.number:
+                return False
+        else:
+            return False
+    return True
+
+
+def _replace_variable(term, var, new):
+    # Replaces all occurrences of var in term, copying only the paths to them.
+    for address in term.variable_addresses().get(var, ()):
+        term = term.replace_at(address, new)
     return term
 
 
+def joint_canonical_key(terms):
+    """Returns a hashable key for a sequence of terms.
+
+    Two sequences of terms have the same key iff there is a variable renaming
+    that makes them identical. Variables are numbered in order of first
+    occurrence, all other terms are represented by prefix-order tokens.
+    """
+    tokens = []
+    var_numbers = {}
+    agenda = list(reversed(terms))
+    while agenda:
+        term = agenda.pop()
+        if isinstance(term, Variable):
+            tokens.append(var_numbers.setdefault(term, len(var_numbers)))
+        elif term._canonical_key is not None and term.ground:
+            # Keys of ground terms don't depend on context, reuse memoized:
+            tokens.extend(term._canonical_key)
+        elif isinstance(term, ComplexTerm):
+            tokens.append((term.functor_name, len(term.args)))
+            agenda.extend(reversed(term.args))
+        elif isinstance(term, ConjunctiveTerm):
+            tokens.append(('()', len(term.conjuncts)))
+            agenda.extend(reversed(term.conjuncts))
+        elif isinstance(term, Atom):
+            tokens.append(('\'', term.name))
+        elif isinstance(term, Number):
+            tokens.append(('#', term.number))
+        else: # List
+            tokens.append(('[]', len(term.elements)))
+            agenda.extend(reversed(term.elements))
+    return tuple(tokens)
+
+
+def from_tokens(tokens):
+    """Converts a canonical key back into a term.
+
+    tokens is a sequence of canonical key tokens for a single term, as returned
+    by canonical_key. Variables are new.
+    """
+    def make_term(kind, children):
+        if kind == '()':
+            return make_conjunctive_term(children)
+        if kind == '[]':
+            return List(children)
+        return make_complex_term(kind, children)
+    variables = collections.defaultdict(Variable)
+    # Stack of open terms, each with its token and its children so far:
+    stack = []
+    for token in tokens:
+        if isinstance(token, int):
+            term = variables[token]
+        else:
+            kind, value = token
+            if kind == '\'':
+                term = make_atom(value)
+            elif kind == '#':
+                term = make_number(value)
+            elif value == 0:
+                term = make_term(kind, [])
+            else:
+                stack.append((kind, value, []))
+                continue
+        while stack:
+            kind, length, children = stack[-1]
+            children.append(term)
+            if len(children) < length:
+                break
+            stack.pop()
+            term = make_term(kind, children)
+        if not stack:
+            return term
+    raise ValueError('incomplete canonical key')
+
+
 def variable_names():
     # The first 26 variable names are the letters of the alphabet:
     yield from 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
@@ -417,23 +835,150 @@ def make_var_name_dict():
     return collections.defaultdict(lambda: next(names))
 
 
+def _has_placeholder(arg):
+    return isinstance(arg, ComplexTerm) or isinstance(arg, ConjunctiveTerm)
+
+
+def memoized_fragments(term):
+    """Returns a tuple of the fragments of term, computed once per term object.
+
+    Unlike term.fragments(), the tuple includes duplicates: fragments that are
+    equivalent on their own may differ within a larger fragment that shares
+    their variables. Since ground terms are interned, shared subterms pay for
+    their fragments only once. Note that the tuple is shared, so if the same
+    term object occurs more than once, its placeholder variables are shared
+    between occurrences.
+    """
+    if not _has_placeholder(term):
+        return (term,)
+    if term._fragments is None:
+        term._fragments = tuple(term._all_fragments())
+    return term._fragments
+
+
+def _unique_fragments(fragments):
+    # Removes duplicates, keeping the first of each class of equivalent
+    # fragments, so FragmentIndex finds the same fragment as before.
+    seen = set()
+    for fragment in fragments:
+        key = fragment.canonical_key()
+        if key not in seen:
+            seen.add(key)
+            yield fragment
+
+
 def args_fragments(args):
-    if args == ():
-        yield ()
-    else:
-        if isinstance(args[0], ComplexTerm) or isinstance(args[0], ConjunctiveTerm):
-            additional_arg_fragments = (from_string('A'),)
+    choices = []
+    for arg in args:
+        if _has_placeholder(arg):
+            choices.append((Variable(),) + memoized_fragments(arg))
         else:
-            additional_arg_fragments = ()
-        for f in itertools.chain(additional_arg_fragments, args[0].fragments()):
-            for g in args_fragments(args[1:]):
-                yield (f,) + g
+            choices.append(memoized_fragments(arg))
+    return itertools.product(*choices)
 
 
 def conjuncts_fragments(conjuncts):
-    if conjuncts == ():
-        yield ()
-    else:
-        for f in conjuncts[0].fragments():
-            for g in conjuncts_fragments(conjuncts[1:]):
-                yield (f,) + g
+    return itertools.product(*(memoized_fragments(c) for c in conjuncts))
+
+
+class FragmentIndex:
+    """Finds fragments of the subterms of a target term.
+
+    index.find(term) returns the same fragment as the first one equivalent to
+    term in the list
+
+        [f for s in target.subterms() for f in s.fragments()]
+
+    or None if there is none. Instead of enumerating that list, whose size is
+    combinatorial in the number of arguments and conjuncts, the fragment is
+    built by matching term against the subterms of target. Results are
+    memoized by the canonical key of term.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.subterms = tuple(target.subterms())
+        self.found = {}
+
+    def find(self, term):
+        key = term.canonical_key()
+        if key not in self.found:
+            self.found[key] = self._find(term)
+        return self.found[key]
+
+    def _find(self, term):
+        for subterm in self.subterms:
+            for fragment, _ in _match_fragments(term, subterm, {}, {}):
+                return fragment
+
+
+def _bind(var, fvar, bindings, inverse):
+    # Extends the variable bijection with var <-> fvar, returns None if that is
+    # inconsistent with it.
+    if var in bindings or fvar in inverse:
+        if bindings.get(var) is fvar:
+            return bindings, inverse
+        return None
+    bindings = dict(bindings)
+    bindings[var] = fvar
+    inverse = dict(inverse)
+    inverse[fvar] = var
+    return bindings, inverse
+
+
+def _match_fragments(term, target, bindings, inverse):
+    # Yields (fragment, (bindings, inverse)) for every fragment of target that
+    # is equivalent to term, in the order of target.fragments(). bindings and
+    # inverse are the variable bijection between term and fragment.
+    if isinstance(target, Variable):
+        if isinstance(term, Variable):
+            extended = _bind(term, target, bindings, inverse)
+            if extended is not None:
+                yield target, extended
+    elif isinstance(target, (Atom, Number)):
+        if target.structural_hash == term.structural_hash and target.subsumes(term):
+            yield target, (bindings, inverse)
+    elif isinstance(target, ComplexTerm):
+        if isinstance(term, ComplexTerm) \
+                and term.functor_name == target.functor_name \
+                and len(term.args) == len(target.args):
+            for args, extended in _match_args_fragments(term.args, target.args, bindings, inverse):
+                yield make_complex_term(target.functor_name, args), extended
+    elif isinstance(target, ConjunctiveTerm):
+        for start in range(0, len(target.conjuncts)):
+            for end in range(start + 1, len(target.conjuncts) + 1):
+                if end - start == 1:
+                    yield from _match_fragments(term, target.conjuncts[start], bindings, inverse)
+                elif isinstance(term, ConjunctiveTerm) and len(term.conjuncts) == end - start:
+                    for conjuncts, extended in _match_conjuncts_fragments(term.conjuncts, target.conjuncts[start:end], bindings, inverse):
+                        yield make_conjunctive_term(conjuncts), extended
+
+
+def _match_args_fragments(args, target_args, bindings, inverse):
+    # Like args_fragments, but only yields fragments equivalent to args.
+    if target_args == ():
+        yield (), (bindings, inverse)
+        return
+    arg = args[0]
+    target_arg = target_args[0]
+    matches = _match_fragments(arg, target_arg, bindings, inverse)
+    if isinstance(target_arg, (ComplexTerm, ConjunctiveTerm)) and isinstance(arg, Variable):
+        # The placeholder variable occurs nowhere else in the fragment.
+        placeholder = Variable()
+        extended = _bind(arg, placeholder, bindings, inverse)
+        if extended is not None:
+            matches = itertools.chain(((placeholder, extended),), matches)
+    for f, extended in matches:
+        for g, extended2 in _match_args_fragments(args[1:], target_args[1:], *extended):
+            yield (f,) + g, extended2
+
+
+def _match_conjuncts_fragments(conjuncts, target_conjuncts, bindings, inverse):
+    # Like conjuncts_fragments, but only yields fragments equivalent to
+    # conjuncts.
+    if target_conjuncts == ():
+        yield (), (bindings, inverse)
+        return
+    for f, extended in _match_fragments(conjuncts[0], target_conjuncts[0], bindings, inverse):
+        for g, extended2 in _match_conjuncts_fragments(conjuncts[1:], target_conjuncts[1:], *extended):
+            yield (f,) + g, extended2
@@ -7,7 +7,7 @@ import unittest
 class AugmentTestCase(unittest.TestCase):
 
     def test_augment1(self):
-        lex = lexicon.read_lexicon('lexicon.txt')
+        lex = lexicon.load_lexicon('lexicon.txt')
         t = terms.from_string('answer(A,longest(A,(river(A),traverse(A,B),state(B),next_to(B,C),most(C,D,(state(C),next_to(C,D),state(D))))))')
         alex = augment.AugmentingLexicon(lex, t)
         word = ('longest',)
@@ -36,7 +36,7 @@ class AugmentTestCase(unittest.TestCase):
         self.assertEqual(meanings, ['most_1(A,B,C)'])
 
     def test_augment2(self):
-        lex = lexicon.read_lexicon('lexicon.txt')
+        lex = lexicon.load_lexicon('lexicon.txt')
         t = terms.from_string('answer(A,lowest(B,(state(A),traverse(C,A),const(C,riverid(mississippi)),loc(B,A),place(B))))')
         alex = augment.AugmentingLexicon(lex, t)
         word = ('states',)
@@ -57,3 +57,18 @@ class AugmentTestCase(unittest.TestCase):
         word = ('point',)
         meanings = [m.to_string() for m in alex.meanings(word)]
         self.assertEqual(meanings, ['place_1(A)'])
+
+    def test_index(self):
+        lex = lexicon.Lexicon({
+            ('state',): ['state(A)'],
+            ('borders',): ['next_to(A,B)'],
+            ('texas',): ['const(A,stateid(texas))'],
+        })
+        t = terms.from_string('answer(A,(state(A),next_to(A,B),state(B),const(B,stateid(texas))))')
+        alex = augment.AugmentingLexicon(lex, t)
+        self.assertEqual(alex.augmented_mr.to_string(), 'answer(A,(state_1(A),next_to_1(A,B),state_2(B),const_1(B,stateid(texas))))')
+        meanings = [m.to_string() for m in alex.meanings(('state',))]
+        self.assertEqual(meanings, ['state_1(A)', 'state_2(A)'])
+        meanings = [m.to_string() for m in alex.meanings(('texas',))]
+        self.assertEqual(meanings, ['const_1(A,stateid(texas))'])
+        self.assertEqual(list(alex.meanings(('river',))), [])
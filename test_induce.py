@@ -0,0 +1,41 @@
+import induce
+import lexicon
+import os
+import tempfile
+import terms
+import unittest
+
+
+class InduceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.examples = [
+            (['which', 'river', 'is', 'longest'], terms.from_string('answer(A,longest(A,river(A)))')),
+            (['name', 'a', 'river'], terms.from_string('answer(A,river(A))')),
+            (['name', 'a', 'state'], terms.from_string('answer(A,state(A))')),
+            (['which', 'state', 'is', 'largest'], terms.from_string('answer(A,largest(A,state(A)))')),
+        ]
+
+    def test_merge(self):
+        counts = induce.count(self.examples, processes=1, shard_size=1)
+        unsharded = induce.Counts()
+        for words, mr in self.examples:
+            unsharded.add_example(words, induce.body(mr))
+        self.assertEqual(counts.examples, 4)
+        self.assertEqual(counts.ngrams, unsharded.ngrams)
+        self.assertEqual(counts.lsts, unsharded.lsts)
+        self.assertEqual(counts.pairs, unsharded.pairs)
+        river = terms.from_string('river(A)').canonical_key()
+        self.assertEqual(counts.pairs[(('river',), river)], 2)
+        self.assertEqual(counts.lsts[river], 2)
+
+    def test_induce(self):
+        counts = induce.count(self.examples, processes=2, shard_size=2)
+        entries = induce.score(counts, min_count=2, threshold=0.9)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'lexicon.txt')
+            induce.write_lexicon(path, entries)
+            lex = lexicon.read_lexicon(path)
+        self.assertEqual([m.to_string() for m in lex.meanings(('river',))], ['river(A)'])
+        self.assertEqual([m.to_string() for m in lex.meanings(('state',))], ['state(A)'])
+        self.assertEqual(lex.meanings(('which',)), ())
@@ -6,10 +6,14 @@ the lexicon is associated with that lexical term. Prints a warning if not.
 """
 
 
+import collections
 import data
 import lexicon
 import terms
 import itertools
+import os
+import pickle
+import tempfile
 import unittest
 import util
 
@@ -24,7 +28,7 @@ class LexiconCoverageTestCase(unittest.TestCase):
         the NLU that in the lexicon is associated with that lexical term.
         """
         missing_terms = []
-        lex = lexicon.read_lexicon('lexicon.txt')
+        lex = lexicon.load_lexicon('lexicon.txt')
         for words, mr in data.geo880_train():
             printed = False
             self.assertEqual(mr.functor_name, 'answer')
@@ -47,3 +51,90 @@ class LexiconCoverageTestCase(unittest.TestCase):
                     print('WARNING: no word found that means ' + lexterm.to_string())
                     missing_terms.append(lexterm)
         self.assertEqual(missing_terms, [])
+
+
+class LexiconTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.lex = lexicon.Lexicon({
+            ('river',): ['river(A)'],
+            ('new', 'york'): ['const(A,stateid(\'new york\'))', 'const(A,cityid(\'new york\',_))'],
+            ('new',): ['new(A)'],
+            ('york',): ['const(A,cityid(york,_))'],
+        })
+
+    def test_meanings(self):
+        m1 = self.lex.meanings(('river',))
+        m2 = self.lex.meanings(('river',))
+        self.assertEqual([m.to_string() for m in m1], ['river(A)'])
+        self.assertIsNot(m1[0], m2[0])
+        self.assertIsNot(m1[0].args[0], m2[0].args[0])
+        self.assertIs(self.lex.templates(('river',))[0], self.lex.templates(('river',))[0])
+        self.assertEqual(self.lex.meanings(('lake',)), ())
+
+    def test_spans(self):
+        words = ('new', 'york', 'river', 'new')
+        spans = [(start, end, m.to_string()) for start, end, m in self.lex.spans(words)]
+        self.assertEqual(spans, [
+            (0, 1, 'new(A)'),
+            (0, 2, "const(A,stateid('new york'))"),
+            (0, 2, "const(A,cityid('new york',B))"),
+            (1, 2, 'const(A,cityid(york,B))'),
+            (2, 3, 'river(A)'),
+            (3, 4, 'new(A)'),
+        ])
+        self.assertEqual(len(list(self.lex.spans(words, max_length=1))), 4)
+
+    def test_lattice(self):
+        words = ('new', 'york', 'river', 'new')
+        lattice = lexicon.Lattice(self.lex, words)
+        self.assertEqual(len(lattice.spans), 6)
+        self.assertEqual([end for end, _ in lattice.starting_at[0]], [1, 2, 2])
+        self.assertEqual(lattice.starting_at[4], [])
+        new = self.lex.templates(('new',))[0].canonical_key()
+        river = self.lex.templates(('river',))[0].canonical_key()
+        self.assertEqual(lattice.suffix_counts[0][new], 2)
+        self.assertEqual(lattice.suffix_counts[1][new], 1)
+        self.assertEqual(lattice.suffix_counts[3][river], 0)
+        self.assertEqual(lattice.suffix_counts[4], collections.Counter())
+
+    def test_load_lexicon(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'lexicon.txt')
+            with open(path, 'w') as f:
+                f.write('# comment\nriver(A) river\nconst(A,stateid(\'new york\')) new,york\n')
+            lex = lexicon.load_lexicon(path)
+            self.assertTrue(os.path.exists(path + '.pickle'))
+            self.assertIs(lexicon.load_lexicon(path), lex)
+            lexicon._loaded.clear()
+            lex2 = lexicon.load_lexicon(path)
+            self.assertIsNot(lex2, lex)
+            self.assertEqual(lex2.word_term_map, lex.word_term_map)
+            self.assertIs(lex2.templates(('new', 'york'))[0].args[1], lex.templates(('new', 'york'))[0].args[1])
+            self.assertEqual(lex2.meanings(('river',))[0].to_string(), 'river(A)')
+            with open(path, 'a') as f:
+                f.write('lake(A) lake\n')
+            lex3 = lexicon.load_lexicon(path)
+            self.assertEqual(lex3.meanings(('lake',))[0].to_string(), 'lake(A)')
+            # A broken compiled lexicon is rebuilt:
+            with open(path + '.pickle', 'r+b') as f:
+                f.truncate(10)
+            lexicon._loaded.clear()
+            lex4 = lexicon.load_lexicon(path)
+            self.assertEqual(lex4.word_term_map, lex3.word_term_map)
+            lexicon._loaded.clear()
+            self.assertIsNotNone(lexicon.load_lexicon(path).word_key_map)
+            # So is a compiled lexicon with the same stamp but another version:
+            with open(path + '.pickle', 'rb') as f:
+                compiled = pickle.load(f)
+            compiled['version'] = 0
+            with open(path + '.pickle', 'wb') as f:
+                pickle.dump(compiled, f)
+            lexicon._loaded.clear()
+            self.assertEqual(lexicon.load_lexicon(path).word_term_map, lex3.word_term_map)
+            # Touching the file only updates the stamp:
+            os.utime(path, ns=(0, 0))
+            lexicon._loaded.clear()
+            self.assertEqual(len(lexicon.load_lexicon(path).templates(('lake',))), 1)
+            with open(path + '.pickle', 'rb') as f:
+                self.assertEqual(pickle.load(f)['stamp'][0], 0)
@@ -26,8 +26,36 @@ class LinkedStackTestCase(unittest.TestCase):
         l = list(u)
         self.assertEqual(l, ['b', 'a'])
 
+    def test_slots(self):
+        self.assertFalse(hasattr(lstack.stack(), '__dict__'))
+        self.assertFalse(hasattr(lstack.stack(['a']), '__dict__'))
+
     def test_list_roundtrip(self):
         l = ['a', 'b', 1, 'c', 2, 3]
         s = lstack.stack(l)
         l2 = list(s)
         self.assertEqual(l, l2)
+
+    def test_long_stack(self):
+        l = list(range(100000))
+        s = lstack.stack(l)
+        self.assertEqual(len(s), 100000)
+        self.assertEqual(s[99999], 99999)
+        self.assertEqual(list(s), l)
+        with self.assertRaises(IndexError):
+            s[100000]
+
+    def test_shared_tail(self):
+        t = lstack.stack(['c', 'd'])
+        s = lstack.stack(['a', 'b'], t)
+        self.assertEqual(list(s), ['a', 'b', 'c', 'd'])
+        self.assertIs(s.pop().pop(), t)
+        self.assertEqual(len(s), 4)
+
+    def test_identity(self):
+        s = lstack.stack(['a', 'b'])
+        self.assertEqual(s, s)
+        self.assertNotEqual(s, lstack.stack(['a', 'b']))
+        self.assertEqual(tuple(s), tuple(lstack.stack().push('b').push('a')))
+        self.assertEqual(len({s, lstack.stack(['a', 'b'])}), 2)
+        self.assertIs(s.pop().pop(), lstack.stack())
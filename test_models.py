@@ -0,0 +1,44 @@
+import models
+import random
+import unittest
+
+
+class ModelsTestCase(unittest.TestCase):
+
+    def _random_features(self, rng):
+        return [('f', rng.randrange(40)) for _ in range(rng.randrange(15))]
+
+    def test_dictionary_mode(self):
+        rng = random.Random(0)
+        perceptron = models.Perceptron()
+        vector = models.VectorPerceptron(size=4)
+        for step in range(200):
+            correct = self._random_features(rng)
+            predicted = self._random_features(rng)
+            perceptron.update(correct, predicted)
+            vector.update(correct, predicted)
+            if step % 50 == 49:
+                averaged = perceptron.copy()
+                averaged.average_weights()
+                averaged_vector = vector.copy()
+                averaged_vector.average_weights()
+                for model, vector_model in ((perceptron, vector), (averaged, averaged_vector)):
+                    agenda = [self._random_features(rng) for _ in range(20)] + [[('unseen',)], []]
+                    self.assertEqual(list(vector_model.score_batch(agenda)),
+                                     model.score_batch(agenda))
+                    self.assertEqual(vector_model.score(agenda[0]), model.score(agenda[0]))
+
+    def test_hashing_mode(self):
+        model = models.VectorPerceptron(hashing=True, size=1 << 10)
+        model.update([('a', 1), ('b',)], [('c',)])
+        self.assertEqual(model.score([('a', 1), ('b',), ('c',)]), 1.0)
+        self.assertEqual(model.score([('d',)]), 0.0)
+        self.assertEqual(model.ids([('a', 1)]), model.copy().ids([('a', 1)]))
+        self.assertTrue(all(0 < i < 1 << 10 for i in model.ids([('a', 1), 'x', 3])))
+
+    def test_new_model(self):
+        self.assertIsInstance(models.new_model('perceptron'), models.Perceptron)
+        self.assertFalse(models.new_model('dictionary').hashing)
+        self.assertTrue(models.new_model('hashing').hashing)
+        with self.assertRaises(ValueError):
+            models.new_model('svm')
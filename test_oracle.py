@@ -1,6 +1,8 @@
+import collections
 import data
 import oracle
 import parseitems
+import seensets
 import terms
 import unittest
 
@@ -39,6 +41,30 @@ class OracleTest(unittest.TestCase):
         actions_oracle = oracle.action_sequence(words, target_mr)
         self.assertEqual(actions_gold, actions_oracle)
 
+    def test_astar(self):
+        words = ('what', 'is', 'the', 'capital', 'of', 'the', 'state', 'with', 'the', 'largest', 'population')
+        target_mr = terms.from_string('answer(C, (capital(S, C), largest(P, (state(S), population(S, P)))))')
+        bfs_stats = collections.Counter()
+        bfs_actions = oracle.action_sequence(words, target_mr, 'bfs', bfs_stats)
+        astar_stats = collections.Counter()
+        astar_actions = oracle.action_sequence(words, target_mr, 'astar', astar_stats)
+        self.assertEqual(astar_actions[-1], ('finish',))
+        self.assertGreaterEqual(len(astar_actions), len(bfs_actions))
+        self.assertLess(astar_stats['expanded'], bfs_stats['expanded'])
+
+    def test_astar_seen_scopes(self):
+        words = ('what', 'is', 'the', 'capital', 'of', 'the', 'state', 'with', 'the', 'largest', 'population')
+        target_mr = terms.from_string('answer(C, (capital(S, C), largest(P, (state(S), population(S, P)))))')
+        memory = {}
+        for scope in ('search', 'offset', 'step'):
+            stats = collections.Counter()
+            seen = seensets.SeenSet('exact', scope)
+            actions = oracle.action_sequence(words, target_mr, 'astar', stats, seen)
+            self.assertEqual(actions[-1], ('finish',))
+            memory[scope] = stats['seen_memory']
+        self.assertLessEqual(memory['offset'], memory['search'])
+        self.assertLessEqual(memory['step'], memory['search'])
+
     #def test_example2(self):
     #    words = ('how', 'many', 'rivers', 'do', 'not', 'traverse', 'the', 'state', 'with', 'the', 'capital', 'albany', '?')
     #    target_mr = terms.from_string('answer(A,count(B,(river(B),\+ (traverse(B,C),state(C),loc(D,C),capital(D),const(D,cityid(albany,_)))),A))')
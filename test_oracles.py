@@ -0,0 +1,67 @@
+import lexicon
+import oracles
+import os
+import signal
+import tempfile
+import terms
+import unittest
+import unittest.mock
+
+
+class OracleCacheTestCase(unittest.TestCase):
+
+    def test_cache(self):
+        words = ('name', 'a', 'river')
+        key = terms.from_string('answer(A,river(A))').canonical_key()
+        lex1 = lexicon.Lexicon({('river',): ['river(A)'], ('lake',): ['lake(A)']})
+        lex2 = lexicon.Lexicon({('river',): ['river(A)'], ('lake',): ['lake(A)', 'loc(A,B)']})
+        lex3 = lexicon.Lexicon({('river',): ['river(A)', 'traverse(A,B)']})
+        with tempfile.TemporaryDirectory() as directory:
+            cache = oracles.OracleCache(directory, lex1, 'bfs')
+            self.assertIsNone(cache.get(words, key))
+            cache.put(words, key, [['skip'], ['finish']])
+            self.assertEqual(cache.get(words, key), ([['skip'], ['finish']], None))
+            # Entries for words not in the sentence don't matter:
+            cache = oracles.OracleCache(directory, lex2, 'bfs')
+            self.assertEqual(cache.get(words, key), ([['skip'], ['finish']], None))
+            cache = oracles.OracleCache(directory, lex3, 'bfs')
+            self.assertIsNone(cache.get(words, key))
+            cache = oracles.OracleCache(directory, lex1, 'astar')
+            self.assertIsNone(cache.get(words, key))
+            self.assertEqual((cache.hits, cache.misses, cache.invalidations), (0, 1, 1))
+            # Failures are cached, but only for the same limits:
+            cache = oracles.OracleCache(directory, lex1, 'bfs', timeout=10)
+            cache.put(words, key, None, 'timeout after 10 s')
+            self.assertEqual(cache.get(words, key), (None, 'timeout after 10 s'))
+            cache = oracles.OracleCache(directory, lex1, 'bfs', timeout=20)
+            self.assertIsNone(cache.get(words, key))
+
+    def test_recorded_indices(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'oracles.json')
+            self.assertEqual(oracles._recorded_indices(path), set())
+            with open(path, 'w') as f:
+                f.write('{"index": 3, "words": []}\n{"index": 1, "words": []}\n{"index": 2, "wo')
+            # The incomplete line of an interrupted run is dropped:
+            self.assertEqual(oracles._recorded_indices(path), {1, 3})
+            with open(path) as f:
+                self.assertEqual(f.read().count('\n'), 2)
+            oracles._sort_by_index(path)
+            with open(path) as f:
+                self.assertEqual(f.readline(), '{"index": 1, "words": []}\n')
+            with open(path, 'w') as f:
+                f.write('{"words": []}\n')
+            with self.assertRaises(ValueError):
+                oracles._recorded_indices(path)
+
+    def test_dead_worker(self):
+        def action_sequence(words, mr, search):
+            if words[0] == 'die':
+                os.kill(os.getpid(), signal.SIGKILL)
+            return [('skip',)]
+        key = terms.from_string('answer(A,river(A))').canonical_key()
+        examples = [(('die',), key), (('live',), key), (('live', 'on'), key)]
+        with unittest.mock.patch.object(oracles.oracle, 'action_sequence', action_sequence):
+            results = list(oracles.search_all(examples, 2))
+        self.assertEqual(results, [(None, 'worker process died'),
+                                   ([('skip',)], None), ([('skip',)], None)])
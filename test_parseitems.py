@@ -353,7 +353,7 @@ class ItemsTestCase(unittest.TestCase):
         Tests that given the words and target_mr, the given actions are found
         and allowed by the oracle.
         """
-        lex = augment.AugmentingLexicon(lexicon.read_lexicon('lexicon.txt'), target_mr)
+        lex = augment.AugmentingLexicon(lexicon.load_lexicon('lexicon.txt'), target_mr)
         beam = oracle.initial_beam(words, target_mr.augment(), lex)
         item = beam.items[0]
         for action in actions:
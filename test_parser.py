@@ -0,0 +1,74 @@
+import models
+import parser
+import unittest
+import unittest.mock
+
+
+class FullItem:
+    """A minimal parse item: one action out of 'xyz' per word.
+    """
+
+    def __init__(self, words, actions=()):
+        self.words = words
+        self.actions = actions
+        self.finished = len(actions) == len(words)
+
+    def successors(self, lex):
+        if self.finished:
+            return [self]
+        return [type(self)(self.words, self.actions + (a,)) for a in 'xyz']
+
+    def action_sequence(self):
+        return list(self.actions)
+
+    def features(self):
+        return [('action', a) for a in self.actions]
+
+
+class Item(FullItem):
+    """A parse item that supports incremental scoring.
+    """
+
+    def action_features(self):
+        return [('action', self.actions[-1])]
+
+
+class ParserTestCase(unittest.TestCase):
+
+    def test_early_update(self):
+        # With a beam of 1 and no weights, the beam keeps 'x', so the gold
+        # action 'y' falls off in the first step:
+        model = models.Perceptron()
+        search = parser.BeamSearch(width=1, width_per_word=0, margin=None, max_steps=None)
+        with unittest.mock.patch.object(parser.parseitems, 'initial', Item, create=True):
+            parser.train_one_epoch([(('a', 'b'), ['y', 'y'])], None, model, search)
+        self.assertEqual(model.score([('action', 'y')]), 1)
+        self.assertEqual(model.score([('action', 'x')]), -1)
+
+    def test_incremental_scores(self):
+        model = models.Perceptron()
+        model.update([('action', 'y')], [('action', 'z')])
+        with unittest.mock.patch.object(parser.parseitems, 'initial', Item, create=True):
+            agenda = [parser.initial_hypothesis(('a', 'b'))]
+            for _ in range(2):
+                agenda = parser.expand(agenda, None, model)
+        self.assertEqual(len(agenda), 9)
+        for h in agenda:
+            self.assertEqual(h.features(), h.item.features())
+            self.assertEqual(h.score, model.score(h.item.features()))
+
+    def test_incremental_matches_full(self):
+        model = models.Perceptron()
+        model.update([('action', 'y'), ('action', 'x')], [('action', 'z')])
+        agendas = []
+        for item_class in (Item, FullItem):
+            with unittest.mock.patch.object(parser.parseitems, 'initial', item_class, create=True):
+                agenda = [parser.initial_hypothesis(('a', 'b', 'c'))]
+                for _ in range(4):
+                    agenda = parser.expand(agenda, None, model)
+            agendas.append([(h.item.actions, h.score, h.features()) for h in agenda])
+        self.assertEqual(agendas[0], agendas[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
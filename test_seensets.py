@@ -0,0 +1,62 @@
+import collections
+import seensets
+import unittest
+
+
+Item = collections.namedtuple('Item', ('offset',))
+
+
+class SeenSetsTestCase(unittest.TestCase):
+
+    def test_exact(self):
+        seen = seensets.SeenSet()
+        self.assertTrue(seen.add(b'a', 0))
+        self.assertTrue(seen.add(b'b', 1))
+        self.assertFalse(seen.add(b'a', 2))
+        seen.step([Item(2)])
+        self.assertFalse(seen.add(b'b', 2))
+        self.assertGreater(seen.finish(), 0)
+
+    def test_offset_scope(self):
+        seen = seensets.SeenSet(scope='offset')
+        self.assertTrue(seen.add(b'a', 0))
+        self.assertFalse(seen.add(b'a', 0))
+        self.assertTrue(seen.add(b'a', 1))
+        seen.step([Item(1), Item(2)])
+        self.assertEqual(list(seen.sets), [1])
+        self.assertFalse(seen.add(b'a', 1))
+        self.assertTrue(seen.add(b'a', 0))
+
+    def test_step_scope(self):
+        seen = seensets.SeenSet(scope='step')
+        self.assertTrue(seen.add(b'a', 0))
+        self.assertFalse(seen.add(b'a', 0))
+        seen.step([Item(0)])
+        peak = seen.peak_memory
+        self.assertGreater(peak, 0)
+        self.assertEqual(seen.memory(), 0)
+        self.assertTrue(seen.add(b'a', 0))
+        self.assertEqual(seen.finish(), peak)
+
+    def test_bloom(self):
+        seen = seensets.SeenSet('bloom', capacity=1000, error_rate=0.01)
+        keys = [str(i).encode() for i in range(1000)]
+        new = sum(seen.add(key, 0) for key in keys)
+        self.assertGreater(new, 980)
+        self.assertFalse(any(seen.add(key, 0) for key in keys))
+        self.assertEqual(seen.memory(), seen.finish())
+        with self.assertRaises(ValueError):
+            seensets.SeenSet('fuzzy')
+
+    def test_bloom_offset_scope(self):
+        seen = seensets.SeenSet('bloom', 'offset', capacity=1000, error_rate=0.01)
+        self.assertTrue(seen.add(b'a', 0))
+        self.assertFalse(seen.add(b'a', 0))
+        self.assertTrue(seen.add(b'a', 1))
+        memory = seen.memory()
+        for offset in range(2, 20):
+            seen.add(b'a', offset)
+        seen.step([Item(19)])
+        # All offsets share one filter:
+        self.assertEqual(seen.memory(), memory)
+        self.assertFalse(seen.add(b'a', 1))
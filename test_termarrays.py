@@ -0,0 +1,31 @@
+import data
+import termarrays
+import terms
+import unittest
+
+
+class TermArraysTestCase(unittest.TestCase):
+
+    def test_roundtrip(self):
+        symbols = termarrays.SymbolTable()
+        for words, mr in data.geo880_train():
+            codes = symbols.encode(mr)
+            self.assertTrue(symbols.decode(codes).equivalent(mr))
+        t = terms.from_string('parse([a,b], c(A, 1, \'d e\'))')
+        self.assertEqual(symbols.decode(symbols.encode(t)).to_string(), t.to_string())
+
+    def test_equivalent(self):
+        symbols = termarrays.SymbolTable()
+        batch1 = symbols.encode_batch([terms.from_string(s) for s in
+                ['a(A,B)', 'a(A,A)', '(b(A),c(A))', 'd', 'e(1)']])
+        batch2 = symbols.encode_batch([terms.from_string(s) for s in
+                ['a(C,D)', 'a(A,B)', '(b(B),c(B))', 'd(e)', 'e(1)']])
+        self.assertEqual(list(termarrays.equivalent(batch1, batch2)),
+                [True, False, True, False, True])
+
+    def test_first_occurrences(self):
+        symbols = termarrays.SymbolTable()
+        batch = symbols.encode_batch([terms.from_string(s) for s in
+                ['a(A,B)', 'a(A,A)', 'a(C,D)', 'a(A,A)', 'b']])
+        self.assertEqual(list(termarrays.first_occurrences(batch)),
+                [True, True, False, False, True])
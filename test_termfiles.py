@@ -0,0 +1,44 @@
+import data
+import os
+import tempfile
+import termfiles
+import terms
+import unittest
+
+
+class TermFilesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_term_file(self):
+        path = os.path.join(self.dir.name, 'terms.bin')
+        strings = ['a(A, (b(B), c(A, stateid(texas))))', 'parse([a, \'b c\'], d(1))', 'X']
+        termfiles.write_term_file(path, [terms.from_string(s) for s in strings])
+        self.assertTrue(termfiles.is_term_file(path))
+        term_file = termfiles.TermFile(path)
+        self.assertEqual(len(term_file), 3)
+        self.assertEqual(term_file[1].to_string(), 'parse([a,\'b c\'], d(1))')
+        self.assertEqual([t.to_string() for t in term_file],
+                [terms.from_string(s).to_string() for s in strings])
+        with self.assertRaises(IndexError):
+            term_file[3]
+        term_file.close()
+
+    def test_geoquery_file(self):
+        path = os.path.join(self.dir.name, 'geo880-test.bin')
+        examples = data.geo880_test()
+        data.write_binary_geoquery_file(path, examples)
+        self.assertFalse(termfiles.is_term_file('data/geo880-test'))
+        for (words1, mr1), (words2, mr2) in zip(examples, data.read_geoquery_file(path)):
+            self.assertEqual(words1, words2)
+            self.assertEqual(mr1.to_string(), mr2.to_string())
+
+    def test_oracle_file(self):
+        path = os.path.join(self.dir.name, 'oracles.bin')
+        oracles = data.read_oracle_file('oracles.json')
+        data.write_binary_oracle_file(path, oracles)
+        self.assertEqual(data.read_oracle_file(path), oracles)
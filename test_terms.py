@@ -1,4 +1,5 @@
 import data
+import gc
 import lstack
 import terms
 import unittest
@@ -15,6 +16,29 @@ class TermsTestCase(unittest.TestCase):
         now = before.replace(A, B)
         self.assertTrue(now.equivalent(after))
 
+    def test_replace_at(self):
+        t = terms.from_string('answer(C, (capital(S, C), largest(P, (state(S), population(S, P)))))')
+        new = terms.from_string('city(X)')
+        u = t.replace_at((2, 2, 2, 1), new)
+        self.assertTrue(u.equivalent(terms.from_string('answer(C, (capital(S, C), largest(P, (city(X), population(S, P)))))')))
+        self.assertIs(u.at_address((2, 2, 2, 1)), new)
+        # Subterms off the path are shared:
+        self.assertIs(u.at_address((2, 1)), t.at_address((2, 1)))
+        self.assertIs(u.at_address((2, 2, 2, 2)), t.at_address((2, 2, 2, 2)))
+        self.assertIs(t.replace_at((), new), new)
+        with self.assertRaises(IndexError):
+            t.replace_at((1, 2), new)
+
+    def test_variable_addresses(self):
+        t = terms.from_string('a(A, (b(B), c(A, d)))')
+        A = t.args[0]
+        B = t.args[1].conjuncts[0].args[0]
+        self.assertEqual(t.variable_addresses(), {A: ((1, 1), (2, 2, 1, 1)), B: ((2, 1, 1, 1),)})
+        u = t.replace(B, A)
+        self.assertTrue(u.equivalent(terms.from_string('a(A, (b(A), c(A, d)))')))
+        self.assertIs(u.args[1].conjuncts[1], t.args[1].conjuncts[1])
+        self.assertIs(t.replace(terms.Variable(), A), t)
+
     def test_subterms(self):
         term = terms.from_string(
             'answer(C, (capital(S, C), largest(P, (state(S), population(S, P)))))')
@@ -68,6 +92,32 @@ class TermsTestCase(unittest.TestCase):
             terms.from_string('answer(A,(state(A),population(D,E)))').subsumes(
             terms.from_string('answer(C,(state(S),population(S,P)))')))
 
+    def test_subsumes_all(self):
+        general1 = terms.from_string('a(A, B)')
+        general2 = terms.ComplexTerm('b', (general1.args[0],))
+        specific1 = terms.from_string('a(X, Y)')
+        specific2 = terms.from_string('b(Z)')
+        pairs = [(general1, specific1), (general2, specific2)]
+        self.assertFalse(terms.subsumes_all(pairs))
+        specific2 = terms.ComplexTerm('b', (specific1.args[0],))
+        pairs = [(general1, specific1), (general2, specific2)]
+        bindings = {}
+        self.assertTrue(terms.subsumes_all(pairs, bindings))
+        self.assertIs(bindings[general1.args[1]], specific1.args[1])
+        def pairs_then_fail():
+            yield terms.from_string('a'), terms.from_string('b')
+            self.fail('pairs consumed after failure')
+        self.assertFalse(terms.subsumes_all(pairs_then_fail()))
+
+    def test_deep_subsumes(self):
+        depth = 5000
+        t1 = terms.from_string('a(' * depth + 'A' + ')' * depth)
+        t2 = terms.from_string('a(' * depth + 'b' + ')' * depth)
+        self.assertTrue(t1.subsumes(t2))
+        self.assertFalse(t2.subsumes(t1))
+        self.assertFalse(t1.equivalent(t2))
+        self.assertTrue(t1.equivalent(terms.from_string('a(' * depth + 'B' + ')' * depth)))
+
     def test_equivalent(self):
         self.assertTrue(
             terms.from_string('X').equivalent(
@@ -115,6 +165,26 @@ class TermsTestCase(unittest.TestCase):
         t1 = terms.from_string('\+_1a(b)')
         self.assertEqual(t1.to_string(), '\+_1a(b)')
 
+    def test_read_term_rest(self):
+        t, rest = terms.read_term('a(B, c). b(C)')
+        self.assertEqual(t.to_string(), 'a(A,c)')
+        self.assertEqual(rest, '. b(C)')
+        with self.assertRaises(RuntimeError):
+            terms.from_string('a(b]')
+
+    def test_read_deep_term(self):
+        depth = 5000
+        t = terms.from_string('a(' * depth + 'b' + ')' * depth)
+        for i in range(depth):
+            t = t.args[0]
+        self.assertEqual(t.name, 'b')
+
+    def test_read_terms(self):
+        ts = terms.read_terms('a(A, B).\nb(A, [c,d]).\n\\+ (c(A),d(A)).\n')
+        self.assertEqual([t.to_string() for t in ts],
+                ['a(A,B)', 'b(A,[c,d])', '\\+ (c(A),d(A))'])
+        self.assertIsNot(ts[0].args[0], ts[1].args[0])
+
     def test_address_complex(self):
         t = terms.from_string('answer(C, (capital(S, C), largest(P, (state(S), population(S, P)))))')
         s = t.at_address(())
@@ -189,6 +259,33 @@ class TermsTestCase(unittest.TestCase):
         pred = [f.to_string() for f in term.fragments()]
         self.assertEqual(pred, gold)
 
+    def test_fragments_unique(self):
+        term = terms.from_string('a((A,b),(b,c))')
+        gold = ['a(A,B)', 'a(A,b)', 'a(A,(b,c))', 'a(A,c)', 'a((A,b),B)',
+                'a((A,b),b)', 'a((A,b),(b,c))', 'a((A,b),c)', 'a(b,A)', 'a(b,b)',
+                'a(b,(b,c))', 'a(b,c)']
+        pred = [f.to_string() for f in term.fragments()]
+        self.assertEqual(pred, gold)
+        self.assertEqual(term.count_fragment_candidates(), 16)
+        self.assertEqual(len(terms.memoized_fragments(term)), 16)
+        self.assertIs(terms.memoized_fragments(term), terms.memoized_fragments(term))
+
+    def test_count_fragment_candidates(self):
+        for words, mr in data.geo880_train()[:100]:
+            for s in mr.subterms():
+                self.assertEqual(s.count_fragment_candidates(), len(terms.memoized_fragments(s)))
+
+    def test_count_fragment_candidates_variable_child(self):
+        term = terms.from_string('a(A,(b,c))')
+        self.assertEqual(term.count_fragment_candidates(), 4)
+        self.assertEqual(len(list(term.fragments())), 4)
+        # Both conjuncts have the fragment a(A), which is generated twice:
+        term = terms.from_string('(a(A),a(B))')
+        self.assertEqual(term.count_fragment_candidates(), 3)
+        self.assertEqual(len(terms.memoized_fragments(term)), 3)
+        self.assertEqual([f.to_string() for f in term.fragments()],
+                         ['a(A)', '(a(A),a(B))'])
+
     def test_fragments5(self):
         term = terms.from_string('a(A,(b,c))')
         gold = ['a(A,B)', 'a(A,b)', 'a(A,(b,c))', 'a(A,c)']
@@ -205,6 +302,24 @@ class TermsTestCase(unittest.TestCase):
         subterm = terms.from_string('lowest(C,(traverse(D,A),const(D,riverid(mississippi)),loc(C,E)))')
         self.assertTrue(any(subterm.subsumes(f) for s in target.subterms() for f in s.fragments()))
 
+    def test_fragment_index(self):
+        for words, mr in data.geo880_train()[:20]:
+            target = mr.augment()
+            fragments = [f for s in target.subterms() for f in s.fragments()]
+            index = terms.FragmentIndex(target)
+            for fragment in fragments:
+                query = terms.from_string(fragment.to_string())
+                expected = next(f for f in fragments if f.equivalent(query))
+                found = index.find(query)
+                # Same fragment, including the variables shared with target:
+                self.assertEqual(
+                    terms.joint_canonical_key((found, target)),
+                    terms.joint_canonical_key((expected, target)))
+        index = terms.FragmentIndex(terms.from_string('a(A,(b(B),c(A)))'))
+        self.assertIsNone(index.find(terms.from_string('a(A,c(B))')))
+        self.assertIsNone(index.find(terms.from_string('(c(A),b(B))')))
+        self.assertIsNotNone(index.find(terms.from_string('a(A,(b(B),c(A)))')))
+
     def test_marked_terms(self):
         t1 = terms.from_string('a(A)')
         t2 = terms.from_string('b(B)')
@@ -226,6 +341,73 @@ class TermsTestCase(unittest.TestCase):
         u = t.augment()
         self.assertEqual(u.to_string(), 'answer(A,lowest_1(B,(state_1(A),traverse_1(C,A),const_1(C,riverid(mississippi)),loc_1(B,A),place_1(B))))')
 
+    def test_interning(self):
+        t1 = terms.from_string('a(A,stateid(texas))')
+        t2 = terms.from_string('b(stateid(texas),1)')
+        self.assertIs(t1.args[1], t2.args[0])
+        self.assertIsNot(t1, terms.from_string('a(A,stateid(texas))'))
+        self.assertIs(t2, terms.from_string('b(stateid(texas),1)'))
+        terms.set_interning(False)
+        try:
+            t3 = terms.from_string('stateid(texas)')
+            self.assertIsNot(t3, t1.args[1])
+            self.assertTrue(t3.equivalent(t1.args[1]))
+            self.assertEqual(t3.structural_hash, t1.args[1].structural_hash)
+        finally:
+            terms.set_interning(True)
+
+    def test_interning_is_weak(self):
+        t = terms.from_string('weak_test(stateid(nowhere))')
+        key = (terms.ComplexTerm, 'weak_test', t.args)
+        self.assertIs(terms._intern_table[key], t)
+        del t
+        gc.collect()
+        self.assertNotIn(key, terms._intern_table)
+
+    def test_canonical_key(self):
+        t1 = terms.from_string('a(A, (b(B), c(A, stateid(texas))))')
+        t2 = terms.from_string('a(X, (b(Y), c(X, stateid(texas))))')
+        t3 = terms.from_string('a(X, (b(X), c(X, stateid(texas))))')
+        self.assertEqual(t1.canonical_key(), t2.canonical_key())
+        self.assertEqual(hash(t1.canonical_key()), hash(t2.canonical_key()))
+        self.assertNotEqual(t1.canonical_key(), t3.canonical_key())
+        self.assertNotEqual(
+            terms.from_string('a(b)').canonical_key(),
+            terms.from_string('a(1)').canonical_key())
+        self.assertNotEqual(
+            terms.from_string('a(b)').canonical_key(),
+            terms.from_string('a(b(A))').canonical_key())
+        self.assertNotEqual(
+            terms.from_string('(a,b)').canonical_key(),
+            terms.from_string('a(b)').canonical_key())
+
+    def test_from_tokens(self):
+        for string in ('a(A, (b(B), c(A, stateid(texas))))', 'parse([a, \'b c\'], d(1))', 'A'):
+            t = terms.from_string(string)
+            u = terms.from_tokens(t.canonical_key())
+            self.assertEqual(u.to_string(), t.to_string())
+        with self.assertRaises(ValueError):
+            terms.from_tokens(terms.from_string('a(b)').canonical_key()[:-1])
+
+    def test_joint_canonical_key(self):
+        a1 = terms.from_string('a(A, B)')
+        b1 = terms.from_string('b(C)')
+        a2 = terms.from_string('a(D, E)')
+        b2 = terms.ComplexTerm('b', (a2.args[1],))
+        self.assertEqual(b1.canonical_key(), b2.canonical_key())
+        self.assertNotEqual(
+            terms.joint_canonical_key((a1, b1)),
+            terms.joint_canonical_key((a2, b2)))
+        b1 = terms.ComplexTerm('b', (a1.args[1],))
+        self.assertEqual(
+            terms.joint_canonical_key((a1, b1)),
+            terms.joint_canonical_key((a2, b2)))
+
+    def test_slots(self):
+        t = terms.from_string('a(A,b,1,(c(A),d(A)))')
+        for term in (t, t.args[0], t.args[1], t.args[2], t.args[3]):
+            self.assertFalse(hasattr(term, '__dict__'))
+
     def test_compute_all_fragments(self):
         count = 0
         for words, mr in data.geo880_train():
@@ -16,7 +16,7 @@ random.seed(1336) # for reproducibility
 
 
 if __name__ == '__main__':
-    lex = lexicon.read_lexicon('lexicon.txt')
+    lex = lexicon.load_lexicon('lexicon.txt')
     train_oracles, val_examples = data.geo880_train_val()
     model = parser.train(train_oracles, val_examples, lex, max_epochs=20, patience=3)
     with open('model.pickle', 'wb') as f: